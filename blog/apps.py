@@ -1,5 +1,53 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def install_search_triggers(sender, using, **kwargs):
+    from . import search
+    conn = connections[using]
+    if conn.vendor == 'sqlite' and search.FTS_TABLE in conn.introspection.table_names():
+        search.install(conn)
+
+
+def install_group_name_index(sender, using, **kwargs):
+    from .models import install_group_name_index
+    conn = connections[using]
+    if 'blog_group' in conn.introspection.table_names():
+        install_group_name_index(conn)
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            # On the raw connection, so these don't show up as queries.
+            connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def register_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        from . import trending
+        trending.register_functions(connection.connection)
 
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.signals import user_logged_out
+        from .auth import forget_logged_out_user, forget_user
+        from .models import Group, forget_theme_counts
+        from . import tasks  # noqa: F401, registers the tasks run_worker knows
+
+        post_migrate.connect(install_search_triggers, sender=self)
+        post_migrate.connect(install_group_name_index, sender=self)
+        connection_created.connect(apply_sqlite_pragmas)
+        connection_created.connect(register_sqlite_functions)
+        post_save.connect(forget_user, sender=get_user_model())
+        post_delete.connect(forget_user, sender=get_user_model())
+        user_logged_out.connect(forget_logged_out_user)
+        post_save.connect(forget_theme_counts, sender=Group)
+        post_delete.connect(forget_theme_counts, sender=Group)
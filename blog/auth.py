@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.sessions.backends import cached_db
+from django.core.cache import caches
+
+
+def user_cache():
+    return caches[settings.AUTH_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user of an authenticated request from the
+    ``AUTH_CACHE_ALIAS`` cache and goes to the database only on a miss.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                user_cache().set(key, user)
+        return user
+
+
+def forget_user(sender, instance, **kwargs):
+    """Drop a saved or deleted user, which covers password changes."""
+    user_cache().delete(user_cache_key(instance.pk))
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        user_cache().delete(user_cache_key(user.pk))
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Database-backed sessions cached in ``SESSION_CACHE_ALIAS`` for at most
+    ``AUTH_CACHE_TIMEOUT`` seconds. Django's cached_db keeps them for the
+    whole session age, so a session flushed by one process would stay
+    valid in the local caches of the others for weeks.
+    """
+    def cache_timeout(self, expiry=None):
+        return min(settings.AUTH_CACHE_TIMEOUT, self.get_expiry_age(expiry=expiry))
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            data = None
+        if data is None:
+            session = self._get_session_from_db()
+            if session is None:
+                return {}
+            data = self.decode(session.session_data)
+            self._cache.set(self.cache_key, data, self.cache_timeout(session.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        # Skip cached_db.SessionStore.save, which caches for the session age.
+        super(cached_db.SessionStore, self).save(must_create)
+        self._cache.set(self.cache_key, self._session, self.cache_timeout())
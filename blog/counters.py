@@ -0,0 +1,152 @@
+"""
+Post view counts buffered in memory and written in batches.
+
+``record_view()`` only increments an in-process counter, so reading a post
+never takes SQLite's write lock. A daemon thread started by the server
+entry points (project2/wsgi.py and the ASGI lifespan) adds the buffered
+counts to ``Post.view_count`` every ``VIEW_COUNT_FLUSH_INTERVAL`` seconds,
+with one ``UPDATE ... CASE`` per ``VIEW_COUNT_BATCH_SIZE`` posts in a
+single transaction.
+
+At exit the buffer is flushed once more. If the database can't take it,
+the counts are spooled to ``VIEW_COUNT_SPOOL_DIR`` and picked up by the
+next flush of any process, so a restart doesn't lose them.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.pid = os.getpid()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def add(self, post_id, count=1):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked after counting: the parent flushes its own counts.
+                self.pending.clear()
+                self.pid = os.getpid()
+                if self.thread is not None:
+                    self.thread = None
+                    self.start()
+            self.pending[post_id] += count
+
+    def start(self):
+        """Flush every ``VIEW_COUNT_FLUSH_INTERVAL`` seconds until exit."""
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='view-counter', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def run(self):
+        while not self.stopped.wait(settings.VIEW_COUNT_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing view counts failed, will retry")
+            finally:
+                connection.close()
+
+    def stop(self):
+        """Stop the flush thread and hand the buffer over to the database or the spool."""
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing view counts at exit failed, spooling them")
+            self.spool()
+
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        return pending
+
+    def flush(self):
+        """Add the buffered and spooled counts to the posts and return how many posts changed."""
+        self.load_spool()
+        pending = self.take()
+        if not pending:
+            return 0
+        try:
+            write_counts(pending)
+        except Exception:
+            with self.lock:
+                self.pending.update(pending)
+            raise
+        return len(pending)
+
+    def spool(self):
+        pending = self.take()
+        if not pending:
+            return
+        os.makedirs(settings.VIEW_COUNT_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(settings.VIEW_COUNT_SPOOL_DIR, f'{uuid.uuid4().hex}.json')
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(pending, output)
+        os.replace(f'{path}.tmp', path)
+
+    def load_spool(self):
+        try:
+            filenames = os.listdir(settings.VIEW_COUNT_SPOOL_DIR)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(settings.VIEW_COUNT_SPOOL_DIR, filename)
+            claimed = f'{path}.{os.getpid()}'
+            try:
+                # Renaming claims the file, so two processes never both load it.
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed) as source:
+                counts = json.load(source)
+            os.remove(claimed)
+            with self.lock:
+                self.pending.update({int(pk): count for pk, count in counts.items()})
+
+
+def write_counts(counts):
+    """Add ``{post_id: views}`` to ``Post.view_count`` in one transaction."""
+    table = Post._meta.db_table
+    items = sorted(counts.items())
+    batch_size = settings.VIEW_COUNT_BATCH_SIZE
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+            ids = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'UPDATE {table} SET view_count = view_count + CASE id {cases} END '
+                f'WHERE id IN ({ids})',
+                [value for item in batch for value in item] + [pk for pk, _ in batch])
+
+
+view_counter = ViewCounter()
+
+
+def record_view(post_id):
+    view_counter.add(post_id)
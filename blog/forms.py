@@ -1,7 +1,14 @@
+import re
+
 from .models import Group, Post
 from django import forms
 from django.contrib.auth.models import User
 
+
+def split_usernames(value):
+    """Split a list of usernames given one per line or separated by commas."""
+    return [name.strip() for name in re.split(r'[,\n]', value) if name.strip()]
+
 class GroupForm(forms.ModelForm):
 
     class Meta:
@@ -17,5 +24,10 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ['title', 'text', 'creator', 'group']
 
+    group = forms.ModelChoiceField(queryset=Group.objects.all())
     title = forms.CharField(label='title', max_length=100)
     text = forms.Textarea()
+    # Read by PostCreate, not saved to the instance; the datetime-local
+    # input of the form sends the 'T' formats.
+    publish_at = forms.DateTimeField(required=False, input_formats=[
+        '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S'])
@@ -0,0 +1,42 @@
+import datetime
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from blog.models import ArchivedPost, Post
+from blog.routers import ARCHIVE, PRIMARY
+
+
+class Command(BaseCommand):
+    help = ("Move the posts published before a cutoff to the archive database, "
+            "--batch-size posts per transaction, keeping blog_post and its "
+            "indexes small.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive posts published more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--vacuum', action='store_true',
+                            help="Give the freed pages of the primary back to the filesystem")
+
+    def handle(self, *args, **options):
+        if connections[ARCHIVE].settings_dict['NAME'] == connections[PRIMARY].settings_dict['NAME']:
+            raise CommandError("The archive database is the primary database")
+        # Creates the archive file and its table on the first run.
+        call_command('migrate', database=ARCHIVE, verbosity=0)
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        posts = Post.objects.published().filter(date_created__lt=cutoff).order_by('pk')
+        total = 0
+        while True:
+            ids = list(posts.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += ArchivedPost.archive(ids)
+            self.stdout.write(f"  archived {total} posts")
+        self.stdout.write(f"Archived {total} posts published before {cutoff:%Y-%m-%d}")
+        if options['vacuum'] and total:
+            with connections[PRIMARY].cursor() as cursor:
+                cursor.execute('VACUUM')
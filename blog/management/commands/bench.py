@@ -0,0 +1,121 @@
+import json
+import math
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from blog import urls
+from blog.models import Group, Post
+from blog.testing import QUERY_BUDGETS
+
+from .seed_benchmark import USERNAME_PREFIX
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(percent / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ("GET every route of blog/urls.py through the test client and report "
+            "p50/p95/p99 latency, query count and peak memory per endpoint as JSON. "
+            "Routes that only change data on POST are measured on their GET handler.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--user', help="Username to browse as; defaults to "
+                                           "the seeded user with most memberships")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        kwargs = self.route_kwargs(user)
+        client = Client()
+        client.force_login(user)
+
+        endpoints = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for pattern in urls.urlpatterns:
+                name = pattern.name
+                url = reverse(name, kwargs={key: kwargs[key]
+                                            for key in pattern.pattern.converters})
+                endpoints[name] = self.measure(client, user, name, url,
+                                               options['iterations'])
+
+        report = json.dumps({'date': timezone.now().isoformat(),
+                             'user': user.username,
+                             'iterations': options['iterations'],
+                             'endpoints': endpoints}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} doesn't exist")
+        user = (User.objects.filter(username__startswith=USERNAME_PREFIX)
+                .annotate(joined=Count('membership')).order_by('-joined').first())
+        if user is None:
+            raise CommandError("No seeded data, run seed_benchmark first")
+        return user
+
+    def route_kwargs(self, user):
+        group = (Group.objects.filter(membership__user=user)
+                 .order_by('-member_count').first())
+        post = (Post.objects.published().filter(creator=user).first() or
+                Post.objects.public().first())
+        draft = (Post.objects.filter(creator=user, date_created=None).first() or
+                 Post.objects.filter(date_created=None).first())
+        if group is None or post is None or draft is None:
+            raise CommandError("Seeded data needs a joined group, a post and a draft")
+        return {'group_id': group.pk, 'pk': post.pk, 'post_id': post.pk,
+                'draft_id': draft.pk}
+
+    def measure(self, client, user, name, url, iterations):
+        timings = []
+        queries = status = None
+        try:
+            for _ in range(iterations):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - start)
+                queries, status = len(captured), response.status_code
+                if name == 'logout':
+                    client.force_login(user)
+
+            tracemalloc.start()
+            try:
+                client.get(url)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            if name == 'logout':
+                client.force_login(user)
+        except Exception as error:
+            return {'url': url, 'error': repr(error)}
+
+        timings.sort()
+        return {'url': url,
+                'status': status,
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p95_ms': round(percentile(timings, 95) * 1000, 3),
+                'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                'queries': queries,
+                'query_budget': QUERY_BUDGETS.get(name),
+                'peak_memory_kb': round(peak / 1024, 1)}
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from blog import urls as blog_urls
+from project2.asgi import WsgiToAsgi
+
+from .bench import Command as BenchCommand
+
+# Read-heavy routes, each fetched in turn by every simulated client.
+ROUTES = ('group_list', 'group_info', 'post_list', 'post_info', 'drafts_list')
+
+
+def http_scope(url, cookie):
+    url = urlsplit(url)
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': url.path,
+            'query_string': url.query.encode(), 'root_path': '',
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())]}
+
+
+class Command(BaseCommand):
+    help = ("Compare requests per second of the read-heavy routes served by one "
+            "WSGI worker, one request at a time, and by project2.asgi with "
+            "--concurrency requests in flight, on the same seeded data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=settings.ASGI_THREADS)
+        parser.add_argument('--user', help="Username to browse as; defaults to "
+                                           "the seeded user with most memberships")
+
+    def handle(self, *args, **options):
+        bench = BenchCommand()
+        user = bench.get_user(options['user'])
+        kwargs = bench.route_kwargs(user)
+        patterns = {pattern.name: pattern for pattern in blog_urls.urlpatterns}
+        urls = [reverse(name, kwargs={key: kwargs[key]
+                                      for key in patterns[name].pattern.converters})
+                for name in ROUTES]
+        client = Client()
+        client.force_login(user)
+        session = client.cookies[settings.SESSION_COOKIE_NAME].value
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session}'
+        scopes = [http_scope(urls[number % len(urls)], cookie)
+                  for number in range(options['requests'])]
+
+        handler = WSGIHandler()
+        wsgi = self.run_wsgi(handler, scopes)
+        asgi = asyncio.run(self.run_asgi(handler, scopes, options['concurrency']))
+        self.stdout.write(json.dumps({
+            'date': timezone.now().isoformat(),
+            'user': user.username,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'routes': urls,
+            'wsgi': wsgi,
+            'asgi': asgi,
+            'speedup': round(asgi['requests_per_second'] / wsgi['requests_per_second'], 2),
+        }, indent=2))
+
+    @staticmethod
+    def summary(statuses, elapsed):
+        return {'seconds': round(elapsed, 3),
+                'requests_per_second': round(len(statuses) / elapsed, 1),
+                'errors': sum(status != 200 for status in statuses)}
+
+    def run_wsgi(self, handler, scopes):
+        adapter = WsgiToAsgi(handler, threads=1)
+        start = time.perf_counter()
+        statuses = [adapter.run_wsgi(scope, b'')[0] for scope in scopes]
+        return self.summary(statuses, time.perf_counter() - start)
+
+    async def run_asgi(self, handler, scopes, concurrency):
+        application = WsgiToAsgi(handler, concurrency)
+
+        async def request(scope):
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+            await application(scope, receive, send)
+            return messages[0]['status']
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(request(scope) for scope in scopes))
+        elapsed = time.perf_counter() - start
+        application.executor.shutdown()
+        return self.summary(statuses, elapsed)
@@ -0,0 +1,48 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from blog.models import Group, Membership, Post
+
+# Exported in this order so an import can resolve every foreign key from
+# records it has already seen. Groups waiting to be purged are left out
+# with everything in them.
+LIVE_GROUP = {'group__pending_delete': False}
+EXPORTS = (
+    ('user', User.objects.all(), ('id', 'username', 'email', 'password', 'date_joined')),
+    ('group', Group.objects.all(), ('id', 'name', 'theme', 'creator', 'date_created',
+                                    'is_private')),
+    ('membership', Membership.objects.filter(**LIVE_GROUP), ('id', 'user', 'group',
+                                                              'date_joined')),
+    ('post', Post.objects.filter(**LIVE_GROUP), ('id', 'title', 'text', 'creator', 'group',
+                                                  'date_created', 'is_private')),
+)
+
+
+class Command(BaseCommand):
+    help = ("Stream users, groups, memberships and posts to a JSON lines file. "
+            "Rows are fetched in chunks, so memory use does not depend on the "
+            "size of the dump.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Output file, or - for stdout")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, path, **options):
+        output = sys.stdout if path == '-' else open(path, 'w')
+        try:
+            for kind, queryset, fields in EXPORTS:
+                rows = (queryset.order_by('pk').values(*fields)
+                        .iterator(chunk_size=options['chunk_size']))
+                count = 0
+                for row in rows:
+                    output.write(json.dumps({'type': kind, **row}, cls=DjangoJSONEncoder))
+                    output.write('\n')
+                    count += 1
+                self.stderr.write(f"Exported {count} {kind}s")
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,176 @@
+import json
+import os
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from blog.models import Group, Membership, Post, TimelineEntry
+
+from .seed_benchmark import next_id
+
+MODELS = {'user': User, 'group': Group, 'membership': Membership, 'post': Post}
+
+
+def parse_date(value, default=None):
+    return parse_datetime(value) if value else default
+
+
+class Command(BaseCommand):
+    help = ("Import users, groups, memberships and posts from a JSON lines file "
+            "written by export_jsonl. Records are inserted in batches, one "
+            "transaction per batch, and progress is checkpointed so an "
+            "interrupted import can continue with --resume.")
+
+    # The checkpoint holds the position in the file and the id counters, so
+    # writing it costs the same after every batch. The new ids given to
+    # exported users and groups are appended to <checkpoint>.ids instead
+    # and read back on resume.
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help="Continue from the checkpoint of a failed run")
+        parser.add_argument('--checkpoint', help="Defaults to <path>.checkpoint")
+
+    def handle(self, path, **options):
+        self.checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        self.ids = {'user': {}, 'group': {}}
+        self.new_ids = []
+        if options['resume'] and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as checkpoint:
+                self.state = json.load(checkpoint)
+            self.load_ids()
+            id_log_mode = 'a'
+        else:
+            first_ids = {kind: next_id(model) for kind, model in MODELS.items()}
+            self.state = {'line': 0, 'offset': 0, 'first_id': first_ids,
+                          'next_id': dict(first_ids)}
+            id_log_mode = 'w'
+
+        kind, batch = None, []
+        number, offset = self.state['line'], self.state['offset']
+        with open(f'{self.checkpoint}.ids', id_log_mode) as self.id_log, \
+                open(path, 'rb') as source:
+            source.seek(offset)
+            for line in source:
+                if line.strip():
+                    record = json.loads(line)
+                    if batch and (record['type'] != kind or
+                                  len(batch) == options['batch_size']):
+                        self.flush(kind, batch, number, offset)
+                        batch = []
+                    kind = record['type']
+                    batch.append(record)
+                number += 1
+                offset += len(line)
+            self.flush(kind, batch, number, offset)
+        self.finish()
+        os.remove(self.checkpoint)
+        os.remove(f'{self.checkpoint}.ids')
+
+    def flush(self, kind, records, line, offset):
+        """Import ``records``, which end at ``line``/``offset``, and checkpoint after them."""
+        if records:
+            if kind not in MODELS:
+                raise CommandError(f"Line {line}: unknown record type {kind!r}")
+            with transaction.atomic():
+                getattr(self, f'import_{kind}s')(records)
+        # The ids go to disk before the checkpoint that skips their records.
+        self.id_log.writelines(f'{kind}\t{source_id}\t{pk}\n'
+                               for kind, source_id, pk in self.new_ids)
+        self.id_log.flush()
+        os.fsync(self.id_log.fileno())
+        self.new_ids = []
+        self.state['line'], self.state['offset'] = line, offset
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(self.state, checkpoint)
+        os.replace(temporary, self.checkpoint)
+
+    def load_ids(self):
+        with open(f'{self.checkpoint}.ids') as id_log:
+            for entry in id_log:
+                kind, source_id, pk = entry.split('\t')
+                self.ids[kind][source_id] = int(pk)
+
+    def map_id(self, kind, source_id, pk):
+        self.ids[kind][str(source_id)] = pk
+        self.new_ids.append((kind, source_id, pk))
+
+    def allocate(self, kind):
+        # Ids are assigned here rather than by the database, so replaying a
+        # batch that was committed before its checkpoint was saved produces
+        # the same ids and is skipped as a conflict.
+        pk = self.state['next_id'][kind]
+        self.state['next_id'][kind] += 1
+        return pk
+
+    def resolve(self, kind, source_id):
+        try:
+            return self.ids[kind][str(source_id)]
+        except KeyError:
+            raise CommandError(f"Unknown {kind} id {source_id} after line {self.state['line']}")
+
+    def import_users(self, records):
+        ids = dict(User.objects.filter(username__in=[record['username'] for record in records])
+                   .values_list('username', 'id'))
+        users = []
+        for record in records:
+            username = record['username']
+            if username not in ids:
+                ids[username] = self.allocate('user')
+                users.append(User(id=ids[username], username=username,
+                                  email=record.get('email', ''),
+                                  password=record.get('password') or make_password(None),
+                                  date_joined=parse_date(record.get('date_joined'),
+                                                         timezone.now())))
+            self.map_id('user', record['id'], ids[username])
+        User.objects.bulk_create(users, ignore_conflicts=True)
+
+    def import_groups(self, records):
+        groups = []
+        for record in records:
+            pk = self.allocate('group')
+            self.map_id('group', record['id'], pk)
+            groups.append(Group(id=pk, name=record['name'], theme=record['theme'],
+                                creator_id=self.resolve('user', record['creator']),
+                                date_created=parse_date(record.get('date_created'),
+                                                        timezone.now()),
+                                is_private=record.get('is_private', False)))
+        Group.objects.bulk_create(groups, ignore_conflicts=True)
+
+    def import_memberships(self, records):
+        Membership.objects.bulk_create(
+            (Membership(id=self.allocate('membership'),
+                        user_id=self.resolve('user', record['user']),
+                        group_id=self.resolve('group', record['group']),
+                        date_joined=parse_date(record.get('date_joined'), timezone.now()))
+             for record in records),
+            ignore_conflicts=True)
+
+    def import_posts(self, records):
+        Post.objects.bulk_create(
+            (Post(id=self.allocate('post'), title=record['title'], text=record['text'],
+                  creator_id=self.resolve('user', record['creator']),
+                  group_id=self.resolve('group', record['group']),
+                  date_created=parse_date(record.get('date_created')),
+                  is_private=record.get('is_private', False)).summarize()
+             for record in records),
+            ignore_conflicts=True)
+
+    def finish(self):
+        """Derive counters and timelines of the imported groups in bulk."""
+        groups = Group.objects.filter(pk__gte=self.state['first_id']['group'],
+                                      pk__lt=self.state['next_id']['group'])
+        with transaction.atomic():
+            groups.rebuild_counters()
+            TimelineEntry.objects.filter(group__in=groups).delete()
+            TimelineEntry.fill(groups)
+        self.stdout.write(self.style.SUCCESS(
+            "Imported " + ", ".join(f"{self.state['next_id'][kind] - self.state['first_id'][kind]} "
+                                    f"{kind}s" for kind in MODELS)))
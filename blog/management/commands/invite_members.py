@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.forms import split_usernames
+from blog.models import Group, Membership
+
+
+class Command(BaseCommand):
+    help = ("Add many users to a group at once. Usernames are read from the "
+            "arguments, or from a file (- for stdin) with --file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('group_id', type=int)
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--file', help="File of usernames, one per line or "
+                                           "separated by commas")
+
+    def handle(self, group_id, usernames, **options):
+        try:
+            group = Group.objects.get(pk=group_id)
+        except Group.DoesNotExist:
+            raise CommandError(f"Group {group_id} doesn't exist")
+        usernames = list(usernames)
+        if options['file']:
+            if options['file'] == '-':
+                usernames += split_usernames(sys.stdin.read())
+            else:
+                with open(options['file']) as source:
+                    usernames += split_usernames(source.read())
+        report = Membership.invite(group, usernames)
+        self.stdout.write(f"Invited {len(report.invited)} users")
+        if report.already_members:
+            self.stdout.write(f"Already members: {', '.join(report.already_members)}")
+        if report.unknown:
+            self.stderr.write(f"Unknown users: {', '.join(report.unknown)}")
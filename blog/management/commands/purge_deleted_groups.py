@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Group
+
+
+class Command(BaseCommand):
+    help = ("Delete the groups marked for deletion with everything in them, in "
+            "batches of --batch-size rows with one short transaction each.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        groups = Group.all_objects.filter(pending_delete=True).order_by('pk')
+        for group in groups:
+            self.stdout.write(f"Purging group {group.pk} {group.name!r}")
+            totals = {}
+
+            def progress(model, count):
+                name = model._meta.verbose_name_plural
+                totals[name] = totals.get(name, 0) + count
+                self.stdout.write(f"  deleted {totals[name]} {name}")
+            group.purge(options['batch_size'], progress)
+        self.stdout.write(f"Purged {len(groups)} groups")
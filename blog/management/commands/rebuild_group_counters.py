@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from blog.models import ArchivedPost, Group
+from blog.routers import archive_available
+
+
+class Command(BaseCommand):
+    help = ("Recompute member_count, post_count, archived_post_count and "
+            "last_post_at of every group")
+
+    def handle(self, *args, **options):
+        if archive_available():
+            archived = dict(ArchivedPost.objects.order_by().values_list('group_id')
+                            .annotate(n=Count('id')))
+            Group.all_objects.exclude(pk__in=archived).update(archived_post_count=0)
+            for group_id, count in archived.items():
+                Group.all_objects.filter(pk=group_id).update(archived_post_count=count)
+        updated = Group.objects.rebuild_counters()
+        self.stdout.write(f"Rebuilt counters of {updated} groups")
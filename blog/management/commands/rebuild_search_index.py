@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of posts from scratch"
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write("Search index rebuilt")
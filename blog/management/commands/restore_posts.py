@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import ArchivedPost
+from blog.routers import archive_available
+
+
+class Command(BaseCommand):
+    help = ("Move archived posts back to the primary database, by id or all "
+            "of a group's, --batch-size posts per transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('post_ids', nargs='*', type=int)
+        parser.add_argument('--group', type=int, help="Restore every archived post of this group")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not options['post_ids'] and options['group'] is None:
+            raise CommandError("Give post ids or --group")
+        if not archive_available():
+            raise CommandError("There is no archive database yet")
+        posts = ArchivedPost.objects.order_by('pk')
+        if options['post_ids']:
+            posts = posts.filter(pk__in=options['post_ids'])
+        if options['group'] is not None:
+            posts = posts.filter(group_id=options['group'])
+        total = 0
+        while True:
+            ids = list(posts.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            total += ArchivedPost.restore(ids)
+            self.stdout.write(f"  restored {total} posts")
+        self.stdout.write(f"Restored {total} posts")
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = ("Publish scheduled drafts when their publish_at comes. Sleeps until "
+            "the next one is due, waking at least every --max-sleep seconds to "
+            "pick up newly scheduled posts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-sleep', type=float, default=60)
+        parser.add_argument('--once', action='store_true',
+                            help="Publish what is due now and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            published = self.publish_due(options['batch_size'])
+            if published:
+                self.stdout.write(f"Published {published} posts")
+            if options['once']:
+                return
+            time.sleep(self.delay(options['max_sleep']))
+
+    def publish_due(self, batch_size):
+        now = timezone.now()
+        total = 0
+        while True:
+            batch = Post.objects.due(now).order_by('publish_at').values('pk')[:batch_size]
+            published = Post.objects.filter(pk__in=batch).publish(now)
+            total += published
+            if published < batch_size:
+                return total
+
+    @staticmethod
+    def delay(max_sleep):
+        next_due = Post.objects.next_due()
+        if next_due is None:
+            return max_sleep
+        return min(max((next_due - timezone.now()).total_seconds(), 0), max_sleep)
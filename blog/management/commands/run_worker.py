@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import queue
+
+
+class Command(BaseCommand):
+    help = ("Run queued tasks on a pool of --concurrency threads, polling the "
+            "task table every --poll seconds when it has nothing due.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--poll', type=float, default=1.0)
+        parser.add_argument('--visibility-timeout', type=float,
+                            default=settings.TASK_VISIBILITY_TIMEOUT)
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once no task is due")
+
+    def handle(self, *args, **options):
+        self.visibility_timeout = options['visibility_timeout']
+        concurrency = options['concurrency']
+        running = set()
+        with ThreadPoolExecutor(concurrency, thread_name_prefix='worker') as pool:
+            while True:
+                tasks = queue.claim(concurrency - len(running), self.visibility_timeout)
+                running.update(pool.submit(self.run, task) for task in tasks)
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                elif not tasks or len(running) == concurrency:
+                    _, running = wait(running, timeout=options['poll'],
+                                      return_when=FIRST_COMPLETED)
+
+    def run(self, task):
+        try:
+            succeeded = queue.run(task)
+        finally:
+            # Threads open their own connections; don't leave them behind.
+            connections.close_all()
+        status = "done" if succeeded else "failed"
+        self.stdout.write(f"{task} {status} (attempt {task.attempts})")
@@ -0,0 +1,123 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blog.models import Group, Membership, Post, TimelineEntry
+
+USERNAME_PREFIX = 'bench_user_'
+PASSWORD = 'bench'
+POSTS_CHUNK = 5000
+
+
+def next_id(model):
+    # The base manager sees every row, groups waiting to be purged included.
+    return (model._base_manager.aggregate(top=Max('id'))['top'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = ("Bulk-create users, groups, memberships and posts for benchmarking. "
+            "Group popularity follows a Zipf distribution, so a few groups are "
+            "huge and most are tiny.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--memberships-per-user', type=int, default=5)
+        parser.add_argument('--draft-ratio', type=float, default=0.05)
+        parser.add_argument('--private-ratio', type=float, default=0.1,
+                            help="Share of private groups; their posts are private")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent of group popularity")
+        parser.add_argument('--days', type=int, default=365,
+                            help="Spread published posts over this many days")
+        parser.add_argument('--batch-size', type=int,
+                            help="Rows per INSERT; defaults to the backend's limit")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete previously seeded data first")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} previously seeded rows")
+
+        now = timezone.now()
+        with transaction.atomic():
+            users = self.create_users(options['users'], batch_size)
+            groups = self.create_groups(rng, users, options, batch_size)
+            weights = [1 / (rank + 1) ** options['skew'] for rank in range(len(groups))]
+            members = self.create_memberships(rng, users, groups, weights, options,
+                                              batch_size, now)
+            self.create_posts(rng, users, groups, weights, members, options,
+                              batch_size, now)
+            seeded = Group.objects.filter(pk__gte=groups[0].pk) if groups else Group.objects.none()
+            seeded.rebuild_counters()
+            TimelineEntry.fill(seeded)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(groups)} groups and "
+            f"{options['posts']} posts"))
+
+    def create_users(self, count, batch_size):
+        first = next_id(User)
+        password = make_password(PASSWORD)
+        users = [User(id=first + i, username=f'{USERNAME_PREFIX}{first + i}',
+                      email=f'{USERNAME_PREFIX}{first + i}@example.com',
+                      password=password)
+                 for i in range(count)]
+        User.objects.bulk_create(users, batch_size=batch_size)
+        return users
+
+    def create_groups(self, rng, users, options, batch_size):
+        first = next_id(Group)
+        themes = [code for code, _ in Group.THEME_CHOICES]
+        groups = [Group(id=first + i, name=f'Group {first + i}',
+                        theme=rng.choice(themes), creator=rng.choice(users),
+                        is_private=rng.random() < options['private_ratio'])
+                  for i in range(options['groups'])]
+        Group.objects.bulk_create(groups, batch_size=batch_size)
+        return groups
+
+    def create_memberships(self, rng, users, groups, weights, options, batch_size, now):
+        members = {group.pk: [] for group in groups}
+        memberships = []
+        for user in users:
+            joined = set(rng.choices(groups, weights, k=options['memberships_per_user']))
+            for group in joined:
+                members[group.pk].append(user)
+                memberships.append(Membership(user=user, group=group, date_joined=now))
+        Membership.objects.bulk_create(memberships, batch_size=batch_size)
+        return members
+
+    def create_posts(self, rng, users, groups, weights, members, options, batch_size, now):
+        span = timedelta(days=options['days']).total_seconds()
+        posts = []
+        for group in rng.choices(groups, weights, k=options['posts']):
+            creator = rng.choice(members[group.pk] or users)
+            date_created = None
+            if rng.random() >= options['draft_ratio']:
+                date_created = now - timedelta(seconds=rng.random() * span)
+            posts.append(Post(title=f'Post in {group.name}',
+                              text=' '.join(rng.choices(WORDS, k=rng.randint(20, 400))),
+                              creator=creator, group=group, date_created=date_created,
+                              is_private=group.is_private).summarize())
+            if len(posts) == POSTS_CHUNK:
+                Post.objects.bulk_create(posts, batch_size=batch_size)
+                posts = []
+        Post.objects.bulk_create(posts, batch_size=batch_size)
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+         'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+         'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+         'consequat duis aute irure in reprehenderit voluptate velit esse cillum '
+         'fugiat nulla pariatur excepteur sint occaecat cupidatat non proident '
+         'sunt culpa qui officia deserunt mollit anim id est laborum').split()
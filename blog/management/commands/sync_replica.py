@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blog.routers import PRIMARY, REPLICA
+
+
+def copy_database(source_path, target_path):
+    """
+    Copy a SQLite file over another with the online backup API. Writers of
+    the source carry on meanwhile; readers of the target wait for the copy.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary database into the read replica with SQLite's "
+            "online backup API, once or every --interval seconds.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep the replica fresh, copying this often")
+
+    def handle(self, *args, **options):
+        primary, replica = connections[PRIMARY], connections[REPLICA]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("sync_replica only copies SQLite databases")
+        while True:
+            start = time.perf_counter()
+            copy_database(primary.settings_dict['NAME'], replica.settings_dict['NAME'])
+            self.stdout.write(f"Replica synced in {time.perf_counter() - start:.3f}s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,203 @@
+"""
+Per-route request metrics in the Prometheus text format.
+
+:class:`MetricsMiddleware` measures the wall time, SQL statement count, SQL
+time and template render time of every request and adds them to histograms
+keyed by the URL name the request resolved to. Each process keeps its own
+histograms in memory and writes them to ``METRICS_DIR/<pid>.json`` at most
+every ``METRICS_FLUSH_INTERVAL`` seconds; the ``/metrics`` view adds up the
+files of all processes, so any worker can answer a scrape. The directory
+should be emptied when the server restarts.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+# Histogram upper bounds, the last one being +Inf.
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'blog_request_duration_seconds': ("Wall time of requests", SECONDS_BUCKETS),
+    'blog_db_queries': ("SQL statements run per request", COUNT_BUCKETS),
+    'blog_db_duration_seconds': ("Time spent in SQL per request", SECONDS_BUCKETS),
+    'blog_template_duration_seconds': ("Time spent rendering templates per request",
+                                       SECONDS_BUCKETS),
+}
+
+# Requests that did not resolve to a route of blog/urls.py.
+OTHER = 'other'
+
+# Stats of the request being served by the current thread.
+current = threading.local()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # A connection execute wrapper.
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class Histograms:
+    """The histograms of this process and their file in ``METRICS_DIR``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {name: {} for name in HISTOGRAMS}
+        self.flushed = 0.0
+
+    def observe(self, name, route, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self.series[name].get(route)
+        if series is None:
+            series = self.series[name][route] = {'buckets': [0] * (len(buckets) + 1),
+                                                 'sum': 0, 'count': 0}
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        series['buckets'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def record(self, route, wall_time, stats):
+        with self.lock:
+            self.observe('blog_request_duration_seconds', route, wall_time)
+            self.observe('blog_db_queries', route, stats.queries)
+            self.observe('blog_db_duration_seconds', route, stats.db_time)
+            self.observe('blog_template_duration_seconds', route, stats.template_time)
+            if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as output:
+            json.dump(self.series, output)
+        os.replace(f'{path}.tmp', path)
+        self.flushed = time.monotonic()
+
+
+histograms = Histograms()
+
+
+def collect():
+    """Add up the histograms written by every process."""
+    with histograms.lock:
+        histograms.flush()
+    totals = {name: {} for name in HISTOGRAMS}
+    for filename in os.listdir(settings.METRICS_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, filename)) as source:
+                series = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for name, routes in series.items():
+            for route, data in routes.items():
+                total = totals[name].setdefault(route, {'buckets': [0] * len(data['buckets']),
+                                                        'sum': 0, 'count': 0})
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], data['buckets'])]
+                total['sum'] += data['sum']
+                total['count'] += data['count']
+    return totals
+
+
+def exposition(totals):
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}.', f'# TYPE {name} histogram']
+        for route, data in sorted(totals[name].items()):
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), data['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{route="{route}"}} {data["sum"]}')
+            lines.append(f'{name}_count{{route="{route}"}} {data["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(exposition(collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@lru_cache(maxsize=None)
+def route_names():
+    from . import urls
+    return frozenset(pattern.name for pattern in urls.urlpatterns)
+
+
+def route_name(request):
+    match = request.resolver_match
+    return match.url_name if match and match.url_name in route_names() else OTHER
+
+
+class MetricsMiddleware:
+    """
+    Record the histograms of every request under its URL name, and add a
+    ``Server-Timing`` header if ``METRICS_SERVER_TIMING`` is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = current.stats = RequestStats()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current.stats = None
+        wall_time = time.perf_counter() - start
+        histograms.record(route_name(request), wall_time, stats)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'app;dur={wall_time * 1000:.1f}, '
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template_time * 1000:.1f}')
+        return response
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        stats = getattr(current, 'stats', None)
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for :class:`MetricsMiddleware`."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .permissions import Access
+from .routers import state
+
+
+class AccessMiddleware:
+    """Attach a lazily built :class:`Access` to every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.access = SimpleLazyObject(lambda: Access(request.user))
+        return self.get_response(request)
+
+
+class ReplicaMiddleware:
+    """
+    Reset the database routing of blog.routers for every request. A client
+    whose request wrote to the primary gets a cookie that keeps its reads on
+    the primary for ``REPLICA_PIN_SECONDS``, until sync_replica has copied
+    the write over.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.replica = state.wrote = False
+        state.pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        try:
+            response = self.get_response(request)
+            if state.wrote:
+                response.set_cookie(settings.REPLICA_PIN_COOKIE, '1',
+                                    max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        finally:
+            state.replica = state.wrote = state.pinned = False
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_is_private'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['date_created', 'id'], name='post_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Group = apps.get_model('blog', 'Group')
+    Membership = apps.get_model('blog', 'Membership')
+    Post = apps.get_model('blog', 'Post')
+    members = (Membership.objects.filter(group=OuterRef('pk')).order_by()
+               .values('group').annotate(n=Count('id')).values('n'))
+    published = Post.objects.filter(group=OuterRef('pk'), date_created__isnull=False)
+    posts = published.order_by().values('group').annotate(n=Count('id')).values('n')
+    last_post = published.order_by('-date_created').values('date_created')[:1]
+    Group.objects.update(member_count=Coalesce(Subquery(members), 0),
+                         post_count=Coalesce(Subquery(posts), 0),
+                         last_post_at=Subquery(last_post))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    schema_editor.execute(
+        "INSERT INTO blog_timelineentry (user_id, post_id, group_id, date_created) "
+        "SELECT m.user_id, p.id, p.group_id, p.date_created "
+        "FROM blog_post p JOIN blog_membership m ON m.group_id = p.group_id "
+        "JOIN blog_group g ON g.id = p.group_id "
+        "WHERE p.date_created IS NOT NULL AND g.member_count <= %s",
+        [settings.TIMELINE_FANOUT_LIMIT])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blog', '0008_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'date_created', 'id'], name='post_group_feed_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Group'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='blog.Post'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'date_created', 'post'], name='timeline_user_idx'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
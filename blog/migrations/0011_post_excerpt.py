@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:55
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+EXCERPT_LENGTH = 200
+
+
+def summarize(text):
+    """blog.models.summarize as it was when the excerpts were added."""
+    words = text.split()
+    return Truncator(' '.join(words)).chars(EXCERPT_LENGTH), len(words)
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    last_pk = 0
+    while True:
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .only('id', 'text')[:1000])
+        if not posts:
+            break
+        for post in posts:
+            post.excerpt, post.word_count = summarize(post.text)
+        Post.objects.bulk_update(posts, ['excerpt', 'word_count'])
+        last_pk = posts[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_date_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
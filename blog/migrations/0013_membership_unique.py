@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    Group = apps.get_model('blog', 'Group')
+    Membership = apps.get_model('blog', 'Membership')
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+    first = Membership.objects.values('user', 'group').annotate(first=Min('id')).values('first')
+    Membership.objects.exclude(id__in=Subquery(first)).delete()
+    # Each duplicate membership also fanned posts out a second time.
+    first = TimelineEntry.objects.values('user', 'post').annotate(first=Min('id')).values('first')
+    TimelineEntry.objects.exclude(id__in=Subquery(first)).delete()
+    members = (Membership.objects.filter(group=OuterRef('pk')).order_by()
+               .values('group').annotate(n=Count('id')).values('n'))
+    Group.objects.update(member_count=Coalesce(Subquery(members), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_post_publish_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='membership',
+            constraint=models.UniqueConstraint(fields=('user', 'group'), name='membership_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_membership_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='pending_delete',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0014_group_pending_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('payload', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('failed', 'Failed')], default='queued', max_length=6)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField()),
+                ('last_error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+# Migrations can't declare an index on an expression, so this one is
+# created with SQL on SQLite.
+GROUP_NAME_INDEX = 'group_name_nocase_idx'
+
+
+def create_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {GROUP_NAME_INDEX} '
+                              f'ON blog_group (name COLLATE NOCASE)')
+
+
+def drop_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GROUP_NAME_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_task'),
+    ]
+
+    # Space used to share 'SP' with Sport. The rows saved with it can't be
+    # told apart, so they stay Sport; Space groups get the new 'SC' code.
+    operations = [
+        migrations.AlterField(
+            model_name='group',
+            name='theme',
+            field=models.CharField(choices=[('GE', 'General'), ('MU', 'Music'), ('SP', 'Sport'), ('TV', 'Television'), ('PL', 'Politics'), ('SC', 'Space'), ('HE', 'Health')], max_length=2),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['theme', 'date_created'], name='group_theme_idx'),
+        ),
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_group_directory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['creator', 'date_created'], name='post_creator_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_post_creator_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['view_count', 'id'], name='post_popular_idx'),
+        ),
+    ]
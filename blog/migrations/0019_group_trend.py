@@ -0,0 +1,73 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:28
+
+from datetime import datetime, timedelta
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+# The scoring of blog.trending, copied so the backfill keeps its meaning
+# whatever happens to that module. The half-life and weights stay settings:
+# the scores have to be on the scale the running site decays them with.
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def log_weight(weight, when):
+    rate = math.log(2) / settings.TRENDING_HALF_LIFE
+    return math.log(weight) + rate * (when - EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def backfill_scores(apps, schema_editor):
+    """Score the posts and memberships recent enough to still count."""
+    Post = apps.get_model('blog', 'Post')
+    Membership = apps.get_model('blog', 'Membership')
+    GroupTrend = apps.get_model('blog', 'GroupTrend')
+    since = timezone.now() - timedelta(seconds=10 * settings.TRENDING_HALF_LIFE)
+    scores = {}
+    events = [
+        (Post.objects.filter(date_created__gte=since).values_list('group_id', 'date_created'),
+         settings.TRENDING_WEIGHTS['post']),
+        (Membership.objects.filter(date_joined__gte=since)
+         .exclude(user_id=models.F('group__creator_id'))
+         .values_list('group_id', 'date_joined'),
+         settings.TRENDING_WEIGHTS['join']),
+    ]
+    for rows, weight in events:
+        for group_id, date in rows.iterator():
+            scores[group_id] = logaddexp(scores.get(group_id), log_weight(weight, date))
+    GroupTrend.objects.bulk_create(
+        (GroupTrend(group_id=group_id, log_score=score) for group_id, score in scores.items()),
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0018_post_view_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupTrend',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='blog.Group')),
+                ('log_score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='grouptrend',
+            index=models.Index(fields=['log_score'], name='group_trend_idx'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
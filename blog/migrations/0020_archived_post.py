@@ -0,0 +1,35 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0019_group_trend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('text', models.TextField()),
+                ('excerpt', models.CharField(blank=True, max_length=200)),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('creator_id', models.IntegerField()),
+                ('group_id', models.IntegerField()),
+                ('date_created', models.DateTimeField()),
+                ('date_updated', models.DateTimeField()),
+                ('is_private', models.BooleanField(default=False)),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('date_archived', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedpost',
+            index=models.Index(fields=['group_id', 'date_created'], name='archived_post_group_idx'),
+        ),
+    ]
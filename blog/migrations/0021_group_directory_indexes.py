@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0020_archived_post'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='group',
+            name='group_theme_idx',
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['date_created', 'id'], name='group_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['theme', 'date_created', 'id'], name='group_theme_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:18
+
+from django.db import migrations
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0021_group_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='group',
+            options={'default_manager_name': 'all_objects'},
+        ),
+        migrations.AlterModelManagers(
+            name='group',
+            managers=[
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0022_group_default_manager'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='archived_post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,6 +1,104 @@
-from django.db import models
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import (Case, Count, DateTimeField, Exists, F, OuterRef, Q, Subquery,
+                              Value, When)
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.text import Truncator
+
+from . import trending
+from .routers import ARCHIVE, archive_available
+
+EXCERPT_LENGTH = 200
+
+# Django's istartswith is a LIKE, which SQLite only serves from an index
+# built with NOCASE collation. Django can't declare one, and drops indexes
+# it doesn't know about when it rebuilds a table, so the index is also
+# reinstalled after every migrate.
+GROUP_NAME_INDEX = 'group_name_nocase_idx'
+
+
+InviteReport = namedtuple('InviteReport', 'invited already_members unknown')
+
+
+def summarize(text):
+    """Return the excerpt and word count stored alongside a post body."""
+    words = text.split()
+    return Truncator(' '.join(words)).chars(EXCERPT_LENGTH), len(words)
+
+
+def install_group_name_index(conn=connection):
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {GROUP_NAME_INDEX} '
+                           f'ON blog_group (name COLLATE NOCASE)')
+
+
+def latest_post_date():
+    return Subquery(Post.objects.published().filter(group=OuterRef('pk'))
+                    .order_by('-date_created').values('date_created')[:1])
+
+
+class GroupQuerySet(models.QuerySet):
+
+    def rebuild_counters(self):
+        """
+        Recompute the denormalized counters of every group in one UPDATE.
+        ``post_count`` includes the ``archived_post_count`` posts in the
+        archive, and ``last_post_at`` is kept when all posts are archived.
+        """
+        members = (Membership.objects.filter(group=OuterRef('pk')).order_by()
+                   .values('group').annotate(n=Count('id')).values('n'))
+        posts = (Post.objects.published().filter(group=OuterRef('pk')).order_by()
+                 .values('group').annotate(n=Count('id')).values('n'))
+        archived_last_post_at = Case(When(archived_post_count__gt=0, then=F('last_post_at')))
+        return self.update(member_count=Coalesce(Subquery(members), 0),
+                           post_count=Coalesce(Subquery(posts), 0) + F('archived_post_count'),
+                           last_post_at=Coalesce(latest_post_date(), archived_last_post_at),
+                           date_updated=timezone.now())
+
+    def directory(self, theme=None, prefix=None):
+        """Filter by theme code and case-insensitive name prefix, each if given."""
+        groups = self
+        if theme:
+            groups = groups.filter(theme=theme)
+        if prefix:
+            groups = groups.filter(name__istartswith=prefix)
+        return groups
+
+    def theme_counts(self):
+        """Return ``{theme: number of groups}`` computed in one GROUP BY."""
+        return dict(self.order_by().values_list('theme').annotate(n=Count('id')))
+
+
+THEME_COUNTS_CACHE_KEY = 'groups:theme_counts'
+
+
+def cached_theme_counts():
+    """
+    ``theme_counts()`` of the whole directory, kept in the default cache for
+    up to ``THEME_COUNTS_TIMEOUT`` seconds since counting reads every group.
+    Changes made in this process drop it at once.
+    """
+    return cache.get_or_set(THEME_COUNTS_CACHE_KEY, Group.objects.theme_counts,
+                            settings.THEME_COUNTS_TIMEOUT)
+
+
+def forget_theme_counts(sender=None, **kwargs):
+    cache.delete(THEME_COUNTS_CACHE_KEY)
+
+
+class GroupManager(models.Manager.from_queryset(GroupQuerySet)):
+    """Groups that are not waiting to be purged."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(pending_delete=False)
+
 
 class Group(models.Model):
 
@@ -10,7 +108,7 @@ class Group(models.Model):
         ('SP', 'Sport'),
         ('TV', 'Television'),
         ('PL', 'Politics'),
-        ('SP', 'Space'),
+        ('SC', 'Space'),
         ('HE', 'Health')
     )
 
@@ -20,11 +118,102 @@ class Group(models.Model):
     date_created = models.DateTimeField(default=timezone.now)
     members = models.ManyToManyField(User, through='Membership', related_name='members')
     is_private = models.BooleanField(default=False)
+    member_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    # How many of the post_count posts archive_posts moved to the archive.
+    archived_post_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+    date_updated = models.DateTimeField(auto_now=True)
+    # Deleted groups are hidden at once and purged by purge_deleted_groups.
+    pending_delete = models.BooleanField(default=False)
 
+    objects = GroupManager()
+    all_objects = GroupQuerySet.as_manager()
+
+    class Meta:
+        # dumpdata, loaddata and the admin see every group, like they see
+        # every membership and post; views use Group.objects.
+        default_manager_name = 'all_objects'
+        indexes = [
+            # Serve the keyset pages of the directory, newest first, with
+            # and without a theme.
+            models.Index(fields=['date_created', 'id'], name='group_feed_idx'),
+            models.Index(fields=['theme', 'date_created', 'id'], name='group_theme_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    # Every change shown on the group page goes through one of these updates,
+    # so date_updated can validate cached copies of the page.
+
+    def touch(self):
+        Group.objects.filter(pk=self.pk).update(date_updated=timezone.now())
+
+    def members_changed(self, delta):
+        Group.objects.filter(pk=self.pk).update(member_count=F('member_count') + delta,
+                                                date_updated=timezone.now())
+
+    def post_published(self, date, count=1):
+        GroupTrend.record(self.pk, settings.TRENDING_WEIGHTS['post'] * count, date)
+        date = Value(date, output_field=DateTimeField())
+        Group.objects.filter(pk=self.pk).update(
+            post_count=F('post_count') + count,
+            last_post_at=Greatest(Coalesce('last_post_at', date), date),
+            date_updated=timezone.now())
+
+    @staticmethod
+    def archived_posts_moved(counts, sign=1):
+        """
+        Add ``sign * count`` to ``archived_post_count`` for each
+        ``{group_id: count}``. ``post_count`` counts archived posts too, so
+        it doesn't change.
+        """
+        for group_id, count in counts.items():
+            Group.all_objects.filter(pk=group_id).update(
+                archived_post_count=F('archived_post_count') + sign * count,
+                date_updated=timezone.now())
+
+    def recount_members(self):
+        members = Membership.objects.filter(group=OuterRef('pk')).order_by().values('group')
+        Group.objects.filter(pk=self.pk).update(
+            member_count=Coalesce(Subquery(members.annotate(n=Count('id')).values('n')), 0),
+            date_updated=timezone.now())
+
+    def post_removed(self):
+        Group.objects.filter(pk=self.pk).update(post_count=F('post_count') - 1,
+                                                last_post_at=latest_post_date(),
+                                                date_updated=timezone.now())
+
+    def mark_deleted(self):
+        Group.all_objects.filter(pk=self.pk).update(pending_delete=True,
+                                                    date_updated=timezone.now())
+        # Keeps the trending query free of a filter on groups.
+        GroupTrend.objects.filter(group=self.pk).delete()
+        forget_theme_counts()
+
+    def purge(self, batch_size=1000, progress=None):
+        """
+        Delete the group with everything in it, ``batch_size`` rows at a time
+        in short transactions, so the write lock is never held for long.
+        ``progress(model, count)`` is called after every batch.
+        """
+        for children in (TimelineEntry.objects.filter(group=self),
+                         Post.objects.filter(group=self),
+                         Membership.objects.filter(group=self)):
+            model = children.model
+            while True:
+                ids = list(children.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    model.objects.filter(pk__in=ids).delete()
+                if progress:
+                    progress(model, len(ids))
+        if archive_available():
+            ArchivedPost.objects.filter(group_id=self.pk).delete()
+        Group.all_objects.filter(pk=self.pk).delete()
+
     @classmethod
     def create(cls, name, theme, creator):
         group = Group(name=name, theme=theme, creator=creator)
@@ -37,25 +226,163 @@ class Membership(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     date_joined = models.DateTimeField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group'], name='membership_unique'),
+        ]
+
     @classmethod
     def create(cls, user, group):
-        membership = Membership(user=user, group=group, date_joined=timezone.now)
-        membership.save()
+        """Add ``user`` to ``group``; joining twice returns the existing membership."""
+        with transaction.atomic():
+            membership = Membership(user=user, group=group, date_joined=timezone.now())
+            try:
+                with transaction.atomic():
+                    membership.save()
+            except IntegrityError:
+                # A double submit, or another request joined first.
+                return Membership.objects.get(user=user, group=group)
+            group.members_changed(1)
+            # A creator joining their own group isn't activity of others.
+            if user.pk != group.creator_id:
+                GroupTrend.record(group.pk, settings.TRENDING_WEIGHTS['join'])
+            TimelineEntry.backfill(user, group)
         return membership
 
+    @classmethod
+    def invite(cls, group, usernames):
+        """
+        Add the users named in ``usernames`` to ``group`` with one query to
+        resolve them and one bulk insert, and return an :class:`InviteReport`.
+        """
+        usernames = list(dict.fromkeys(usernames))
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        members = set(Membership.objects.filter(group=group, user_id__in=users.values())
+                      .values_list('user_id', flat=True))
+        invited = [name for name, pk in users.items() if pk not in members]
+        if invited:
+            now = timezone.now()
+            with transaction.atomic():
+                Membership.objects.bulk_create(
+                    (Membership(user_id=users[name], group=group, date_joined=now)
+                     for name in invited),
+                    ignore_conflicts=True)
+                # Users who joined concurrently were skipped as conflicts;
+                # the rows inserted here are the ones dated now.
+                inserted = set(Membership.objects.filter(
+                    group=group, user_id__in=[users[name] for name in invited],
+                    date_joined=now).values_list('user_id', flat=True))
+                members.update(users[name] for name in invited if users[name] not in inserted)
+                invited = [name for name in invited if users[name] in inserted]
+                group.recount_members()
+                joined = sum(users[name] != group.creator_id for name in invited)
+                if joined:
+                    GroupTrend.record(group.pk, settings.TRENDING_WEIGHTS['invite'] * joined)
+                if invited:
+                    TimelineEntry.backfill_many([users[name] for name in invited], group)
+        return InviteReport(invited=invited,
+                            already_members=[name for name in usernames
+                                             if users.get(name) in members],
+                            unknown=[name for name in usernames if name not in users])
+
+    @classmethod
+    def remove(cls, user, group):
+        with transaction.atomic():
+            deleted, _ = Membership.objects.filter(user=user, group=group).delete()
+            if deleted:
+                group.members_changed(-deleted)
+                TimelineEntry.objects.filter(user=user, group=group).delete()
+        return deleted
+
 
     def __str__(self):
         return f"{self.user.username} in {self.group.name} group"
 
 
+class PostQuerySet(models.QuerySet):
+
+    def published(self):
+        return self.filter(date_created__isnull=False)
+
+    def public(self):
+        return self.published().filter(is_private=False, group__pending_delete=False)
+
+    def visible_to(self, user):
+        """
+        Posts ``user`` may read: their own drafts, and the published posts of
+        live groups that are public or that they belong to.
+
+        Membership is checked with an EXISTS probe of ``membership_unique``,
+        so this stays a single query that can still walk the feed indexes.
+        """
+        posts = self.filter(group__pending_delete=False)
+        if not user.is_authenticated:
+            return posts.filter(date_created__isnull=False, is_private=False)
+        member = Membership.objects.filter(group=OuterRef('group'), user=user.pk)
+        return posts.annotate(viewer_is_member=Exists(member)).filter(
+            Q(date_created__isnull=True, creator=user.pk) |
+            Q(date_created__isnull=False) & (Q(is_private=False) | Q(viewer_is_member=True)))
+
+    def due(self, now):
+        """Scheduled drafts whose time has come, read from ``post_publish_at_idx``."""
+        return self.filter(publish_at__lte=now, date_created__isnull=True)
+
+    def next_due(self):
+        return (self.filter(publish_at__isnull=False, date_created__isnull=True)
+                .order_by('publish_at').values_list('publish_at', flat=True).first())
+
+    def publish(self, now=None, defer_fan_out=False):
+        """
+        Publish the drafts of this queryset with a single UPDATE, then bring
+        the counters of their groups and their members' timelines up to date
+        in the same transaction. Return the number of posts published.
+
+        With ``defer_fan_out`` the timelines are left to a worker.
+        """
+        from .tasks import fan_out_posts
+        now = now or timezone.now()
+        with transaction.atomic():
+            drafts = dict(self.filter(date_created__isnull=True).values_list('id', 'group_id'))
+            if not drafts:
+                return 0
+            posts = Post.objects.filter(pk__in=list(drafts))
+            posts.update(date_created=now, publish_at=None, date_updated=now)
+            for group_id, count in Counter(drafts.values()).items():
+                Group(pk=group_id).post_published(now, count)
+            if defer_fan_out:
+                fan_out_posts.delay(list(drafts))
+            else:
+                TimelineEntry.fan_out_many(posts)
+        return len(drafts)
+
+
 class Post(models.Model):
 
     title = models.CharField(max_length=100)
     text = models.TextField()
+    # Lists render these instead of loading the whole text.
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    word_count = models.PositiveIntegerField(default=0)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_creator')
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='post_group')
     date_created = models.DateTimeField(null=True)
+    date_updated = models.DateTimeField(auto_now=True)
     is_private = models.BooleanField(default=False)
+    # When run_scheduler should publish this draft; cleared once it has.
+    publish_at = models.DateTimeField(null=True, blank=True)
+    # Written in batches by blog.counters, never on the request path.
+    view_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='post_feed_idx'),
+            models.Index(fields=['group', 'date_created', 'id'], name='post_group_feed_idx'),
+            models.Index(fields=['date_created', 'publish_at'], name='post_publish_at_idx'),
+            models.Index(fields=['creator', 'date_created'], name='post_creator_idx'),
+            models.Index(fields=['view_count', 'id'], name='post_popular_idx'),
+        ]
 
     @classmethod
     def create(cls, title, text, creator, group):
@@ -64,3 +391,229 @@ class Post(models.Model):
         post.save()
         return post
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            self.summarize()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt', 'word_count'}
+        super().save(*args, **kwargs)
+
+    def summarize(self):
+        """Derive the excerpt and word count, for posts saved without save()."""
+        self.excerpt, self.word_count = summarize(self.text)
+        return self
+
+    def on_publish(self):
+        """
+        Update the state derived from published posts once this one is.
+        Copying it into the members' timelines is left to a worker.
+        """
+        from .tasks import fan_out_posts
+        self.group.post_published(self.date_created)
+        if TimelineEntry.fans_out(self.group):
+            fan_out_posts.delay([self.pk])
+
+
+class TimelineEntry(models.Model):
+    """
+    A published post copied into the timeline of one member of its group,
+    so a user's feed is a single range scan of ``timeline_user_idx``.
+
+    Posts of groups with more than ``TIMELINE_FANOUT_LIMIT`` members are not
+    copied; readers merge them in from ``blog_post`` instead.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    date_created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date_created', 'post'], name='timeline_user_idx'),
+        ]
+
+    @staticmethod
+    def fans_out(group):
+        return group.member_count <= settings.TIMELINE_FANOUT_LIMIT
+
+    @classmethod
+    def fill(cls, groups):
+        """Copy every published post of a queryset of groups into their members' timelines."""
+        groups = groups.filter(member_count__lte=settings.TIMELINE_FANOUT_LIMIT)
+        cls._copy_posts('p.group_id', groups.values('pk'))
+
+    @classmethod
+    def fan_out_many(cls, posts):
+        """Copy a queryset of published posts into their members' timelines."""
+        posts = posts.filter(group__member_count__lte=settings.TIMELINE_FANOUT_LIMIT)
+        cls._copy_posts('p.id', posts.values('pk'))
+
+    @classmethod
+    def _copy_posts(cls, column, values):
+        # One INSERT ... SELECT, skipping copies that already exist, so a
+        # retried task or a backfill on joining can't duplicate entries.
+        try:
+            values_sql, params = values.query.sql_with_params()
+        except EmptyResultSet:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {cls._meta.db_table} (user_id, post_id, group_id, date_created) "
+                f"SELECT m.user_id, p.id, p.group_id, p.date_created "
+                f"FROM {Post._meta.db_table} p JOIN {Membership._meta.db_table} m "
+                f"ON m.group_id = p.group_id "
+                f"WHERE p.date_created IS NOT NULL AND {column} IN ({values_sql}) "
+                f"AND NOT EXISTS (SELECT 1 FROM {cls._meta.db_table} t "
+                f"WHERE t.user_id = m.user_id AND t.date_created = p.date_created "
+                f"AND t.post_id = p.id)",
+                params)
+
+    @classmethod
+    def backfill(cls, user, group):
+        """Copy the latest posts of a group the user has just joined."""
+        cls.backfill_many([user.pk], group)
+
+    @classmethod
+    def backfill_many(cls, user_ids, group):
+        if not cls.fans_out(group):
+            return
+        posts = list(Post.objects.published().filter(group=group)
+                     .order_by('-date_created', '-id')
+                     .values_list('id', 'date_created')[:settings.TIMELINE_BACKFILL])
+        cls.objects.bulk_create(cls(user_id=user_id, post_id=pk, group=group, date_created=date)
+                                for user_id in user_ids for pk, date in posts)
+
+
+class GroupTrend(models.Model):
+    """The trending score of a group in the log domain, see :mod:`blog.trending`."""
+
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, primary_key=True,
+                                 related_name='trend')
+    log_score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['log_score'], name='group_trend_idx'),
+        ]
+
+    @classmethod
+    def record(cls, group_id, weight, when=None):
+        """Add an event of ``weight`` at ``when`` to the group's score with one upsert."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} (group_id, log_score) VALUES (%s, %s) '
+                f'ON CONFLICT (group_id) DO UPDATE '
+                f'SET log_score = {trending.LOGADDEXP}(log_score, excluded.log_score)',
+                [group_id, trending.log_weight(weight, when or timezone.now())])
+
+    def score(self, now=None):
+        return trending.current_score(self.log_score, now)
+
+
+class ArchivedPost(models.Model):
+    """
+    A published post moved out of ``blog_post`` by archive_posts. It lives
+    in the ``archive`` database, so its user and group are plain ids.
+    """
+
+    # Copied as they are between Post and ArchivedPost.
+    FIELDS = ('id', 'title', 'text', 'excerpt', 'word_count', 'creator_id', 'group_id',
+              'date_created', 'date_updated', 'is_private', 'view_count')
+
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    text = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    creator_id = models.IntegerField()
+    group_id = models.IntegerField()
+    date_created = models.DateTimeField()
+    date_updated = models.DateTimeField()
+    is_private = models.BooleanField(default=False)
+    view_count = models.PositiveIntegerField(default=0)
+    date_archived = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group_id', 'date_created'], name='archived_post_group_idx'),
+        ]
+
+    def as_post(self):
+        """An unsaved Post with the same contents, for the templates of posts."""
+        return Post(**{field: getattr(self, field) for field in self.FIELDS})
+
+    @classmethod
+    def archive(cls, ids):
+        """
+        Move the published posts with ``ids`` to the archive and return how
+        many moved. They are copied first and deleted from the primary
+        after, so a crash in between leaves a copy to overwrite next time,
+        never a lost post.
+        """
+        rows = list(Post.objects.published().filter(pk__in=ids).values(*cls.FIELDS))
+        if not rows:
+            return 0
+        with transaction.atomic(using=ARCHIVE):
+            cls.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            cls.objects.bulk_create([cls(**row) for row in rows])
+        with transaction.atomic():
+            # Cascades to the timeline entries and fires the search triggers.
+            Post.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            Group.archived_posts_moved(Counter(row['group_id'] for row in rows))
+        return len(rows)
+
+    @classmethod
+    def restore(cls, ids):
+        """Move the archived posts with ``ids`` back to the primary and return how many moved."""
+        archived = list(cls.objects.filter(pk__in=ids))
+        if not archived:
+            return 0
+        with transaction.atomic():
+            # Posts restored by a run that died before cleaning the archive.
+            restored = set(Post.objects.filter(pk__in=[post.pk for post in archived])
+                           .values_list('pk', flat=True))
+            missing = [post for post in archived if post.pk not in restored]
+            Post.objects.bulk_create([post.as_post() for post in missing])
+            Group.archived_posts_moved(Counter(post.group_id for post in missing), -1)
+        with transaction.atomic(using=ARCHIVE):
+            cls.objects.filter(pk__in=[post.pk for post in archived]).delete()
+        return len(archived)
+
+
+class TaskQuerySet(models.QuerySet):
+
+    def due(self, now):
+        return self.filter(status=Task.QUEUED, run_at__lte=now)
+
+
+class Task(models.Model):
+    """A queued call of a function registered with :func:`blog.queue.task`."""
+
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=200)
+    payload = models.TextField()
+    status = models.CharField(choices=STATUS_CHOICES, max_length=6, default=QUEUED)
+    # When the task is next due: on enqueue, after the visibility timeout of
+    # a claim, or after the backoff of a failed attempt.
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(default=timezone.now)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
@@ -0,0 +1,74 @@
+"""
+Whole-page cache for pages that look the same to many visitors.
+
+Two kinds of pages are served from the ``PAGE_CACHE_ALIAS`` cache:
+
+* the routes in ``PAGE_CACHE_ANONYMOUS_ROUTES`` requested by anonymous
+  visitors, which :class:`PageCacheMiddleware` answers without calling the
+  view;
+* the page of a public group as seen by non-members. ``GroupPage`` stores
+  it with the group's ``date_updated`` and uses it only while that matches;
+  every change shown on the page bumps it, so edits purge the copy.
+
+CSRF tokens are replaced with a placeholder before a page is stored and
+with a token of the current visitor when it is served, so a cached page
+never hands out someone else's token.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[A-Za-z0-9]+(")')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def page_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def shared_page(request, key, version, render):
+    """
+    Return the copy of a page stored under ``key`` if it has ``version``,
+    else call ``render()`` and store its response for the next visitor.
+    """
+    cached = page_cache().get(key)
+    if cached is not None and cached['version'] == version:
+        content = cached['content'].replace(CSRF_PLACEHOLDER, get_token(request).encode())
+        response = HttpResponse(content, content_type=cached['content_type'])
+        patch_vary_headers(response, ('Cookie',))
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    response = render()
+    # Pages that set cookies of their own are about this visitor.
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        page_cache().set(key, {
+            'version': version,
+            'content': CSRF_INPUT.sub(rb'\g<1>' + CSRF_PLACEHOLDER + rb'\g<2>',
+                                      response.content),
+            'content_type': response['Content-Type'],
+        }, settings.PAGE_CACHE_TIMEOUT)
+    return response
+
+
+class PageCacheMiddleware:
+    """Serve ``PAGE_CACHE_ANONYMOUS_ROUTES`` to anonymous visitors from the cache."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return self.get_response(request)
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            url_name = None
+        if url_name not in settings.PAGE_CACHE_ANONYMOUS_ROUTES:
+            return self.get_response(request)
+        return shared_page(request, f'page:anonymous:{url_name}', None,
+                           lambda: self.get_response(request))
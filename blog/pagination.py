@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from django.db import connections
+from django.http import Http404
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(value, pk):
+    """Pack a ``(datetime, id)`` pair into an url-safe cursor string."""
+    micros = (value - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{pk}'
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        raise Http404("Invalid page cursor")
+
+
+def after_cursor(queryset, cursor, field='date_created', tiebreak='id'):
+    """
+    Order ``queryset`` newest first by ``(field, tiebreak)`` and keep the rows
+    that come after ``cursor``.
+
+    The rows are located with a row-value comparison instead of an OFFSET,
+    so SQLite seeks straight into the ``(field, tiebreak)`` index at any
+    depth. The equivalent ``field < v OR (field = v AND tiebreak < pk)``
+    makes it OR two index lookups together and sort what they return.
+    """
+    queryset = queryset.order_by(f'-{field}', f'-{tiebreak}')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        connection = connections[queryset.db]
+        opts = queryset.model._meta
+        qn = connection.ops.quote_name
+        columns = ', '.join(f'{qn(opts.db_table)}.{qn(opts.get_field(name).column)}'
+                            for name in (field, tiebreak))
+        queryset = queryset.extra(where=[f'({columns}) < (%s, %s)'],
+                                  params=[connection.ops.adapt_datetimefield_value(value), pk])
+    return queryset
+
+
+def split_page(items, page_size, key):
+    """
+    Cut ``page_size + 1`` fetched items down to one page and return it with
+    the cursor of the next page (None on the last page). ``key`` returns the
+    ``(datetime, id)`` sort key of an item.
+    """
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, encode_cursor(*key(items[-1]))
+
+
+def keyset_page(queryset, cursor, page_size, field='date_created'):
+    """Return one page of ``queryset`` ordered newest first and the next cursor."""
+    items = list(after_cursor(queryset, cursor, field)[:page_size + 1])
+
+    def key(item):
+        if isinstance(item, dict):
+            return item[field], item['id']
+        return getattr(item, field), item.pk
+    return split_page(items, page_size, key)
@@ -0,0 +1,33 @@
+from django.utils.functional import cached_property
+
+from .models import Membership
+
+
+class Access:
+    """
+    Permission checks for the user of one request.
+
+    The user's memberships are loaded with a single query the first time
+    they are needed; ownership is read from the ``creator_id`` of objects
+    the view has already fetched, so every check after that is in memory.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def group_ids(self):
+        if not self.user.is_authenticated:
+            return set()
+        return set(Membership.objects.filter(user=self.user)
+                   .values_list('group_id', flat=True))
+
+    def is_member(self, group):
+        return group.pk in self.group_ids
+
+    def is_creator(self, obj):
+        return self.user.is_authenticated and obj.creator_id == self.user.pk
+
+    def can_post(self, group):
+        return self.is_member(group)
+
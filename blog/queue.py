@@ -0,0 +1,104 @@
+"""
+A task queue stored in the ``blog_task`` table, so deferred work needs no
+broker besides the database the site already uses.
+
+Functions decorated with :func:`task` are queued with ``func.delay(...)``
+and run by ``manage.py run_worker``. A worker claims a task by moving its
+``run_at`` past the visibility timeout; if the worker dies, the task becomes
+due again once that time has passed. Failed tasks are retried with
+exponential backoff up to ``max_attempts`` times. Delivery is at least once,
+so tasks must be safe to run twice.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func=None, *, max_attempts=None):
+    """Register ``func`` as a task and give it a ``delay()`` method to queue it."""
+    def register(func):
+        name = f'{func.__module__}.{func.__name__}'
+        registry[name] = func
+
+        def delay(*args, **kwargs):
+            return enqueue(name, args, kwargs, max_attempts=max_attempts)
+        func.delay = delay
+        return func
+    return register(func) if func else register
+
+
+def enqueue(name, args=(), kwargs=None, delay=0, max_attempts=None):
+    """Queue a call of the task ``name``. Arguments must be JSON serializable."""
+    if name not in registry:
+        raise KeyError(f"Unknown task {name!r}")
+    return Task.objects.create(
+        name=name,
+        payload=json.dumps([list(args), kwargs or {}]),
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(settings.TASK_RETRY_DELAY * 2 ** (attempts - 1),
+                                 settings.TASK_MAX_RETRY_DELAY))
+
+
+def claim(limit, visibility_timeout=None):
+    """
+    Claim up to ``limit`` due tasks, oldest first. Each claim is a
+    conditional UPDATE, so concurrent workers never claim the same task.
+    """
+    now = timezone.now()
+    hidden_until = now + timedelta(seconds=visibility_timeout or settings.TASK_VISIBILITY_TIMEOUT)
+    claimed = []
+    for task in Task.objects.due(now).order_by('run_at', 'pk')[:limit]:
+        if Task.objects.filter(pk=task.pk, status=Task.QUEUED, run_at=task.run_at).update(
+                run_at=hidden_until, attempts=F('attempts') + 1):
+            task.attempts += 1
+            claimed.append(task)
+    return claimed
+
+
+def run(task):
+    """Run a claimed task, then delete it or schedule its retry. Return whether it succeeded."""
+    tasks = Task.objects.filter(pk=task.pk)
+    if task.attempts > task.max_attempts:
+        # Workers kept dying before finishing it.
+        tasks.update(status=Task.FAILED, last_error="Visibility timeout expired")
+        return False
+    try:
+        args, kwargs = json.loads(task.payload)
+        registry[task.name](*args, **kwargs)
+    except Exception:
+        logger.exception("Task %s #%s failed", task.name, task.pk)
+        if task.attempts >= task.max_attempts:
+            tasks.update(status=Task.FAILED, last_error=traceback.format_exc())
+        else:
+            tasks.update(run_at=timezone.now() + backoff(task.attempts),
+                         last_error=traceback.format_exc())
+        return False
+    tasks.delete()
+    return True
+
+
+def run_due_tasks():
+    """Run every due task in this thread and return how many ran."""
+    count = 0
+    while True:
+        tasks = claim(100)
+        if not tasks:
+            return count
+        for task in tasks:
+            run(task)
+        count += len(tasks)
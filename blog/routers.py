@@ -0,0 +1,82 @@
+import os
+import threading
+from functools import wraps
+
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+ARCHIVE = 'archive'
+
+# Models stored in the archive database instead of the primary.
+ARCHIVED_MODELS = {'archivedpost'}
+
+# Per-thread routing state of the request being served, reset by
+# blog.middleware.ReplicaMiddleware.
+state = threading.local()
+
+
+def separate_database_exists(alias):
+    """
+    Whether ``alias`` is configured and its file has been created, and is
+    not the primary file itself, as it is for a test mirror.
+    """
+    if alias not in connections.databases:
+        return False
+    name = connections[alias].settings_dict['NAME']
+    return name != connections[PRIMARY].settings_dict['NAME'] and os.path.exists(name)
+
+
+def replica_available():
+    """The replica is used only once sync_replica has created it."""
+    return separate_database_exists(REPLICA)
+
+
+def archive_available():
+    """Pages look up the archive only once archive_posts has created it."""
+    return separate_database_exists(ARCHIVE)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send the reads of views wrapped in :func:`reads_from_replica` to the
+    replica and every other query to the primary. Once a request writes,
+    its remaining reads go to the primary too, so it sees its own writes.
+    Archived models always use the archive.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.model_name in ARCHIVED_MODELS:
+            return ARCHIVE
+        if (getattr(state, 'replica', False) and not getattr(state, 'wrote', False)
+                and replica_available()):
+            return REPLICA
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if model._meta.model_name in ARCHIVED_MODELS:
+            return ARCHIVE
+        state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a page-by-page copy of the primary, schema included.
+        if model_name in ARCHIVED_MODELS:
+            return db == ARCHIVE
+        return db == PRIMARY
+
+
+def reads_from_replica(view):
+    """
+    Route the reads of a safe request to the replica until the response is
+    rendered, unless the client has recently written to the primary.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD') and not getattr(state, 'pinned', False):
+            state.replica = True
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,107 @@
+"""
+Full-text search over posts with an SQLite FTS5 index.
+
+``blog_post_fts`` is an external-content FTS5 table over ``blog_post``:
+it stores only the index, and triggers keep it in sync with every insert,
+update and delete, bulk operations included. Visibility is decided when
+searching, so publishing a draft needs no reindexing.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'blog_post_fts'
+
+# bm25() weights of the indexed columns: a match in the title ranks higher.
+TITLE_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+
+CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title, text, content='blog_post', content_rowid='id'
+)
+"""
+
+# SQLite drops triggers with their table, and Django rebuilds blog_post for
+# some schema changes, so these are also reinstalled after every migrate.
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text)
+        VALUES ('delete', old.id, old.title, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, text ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text)
+        VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+]
+
+SEARCH = f"""
+SELECT p.id
+FROM {FTS_TABLE} JOIN blog_post p ON p.id = {FTS_TABLE}.rowid
+JOIN blog_group g ON g.id = p.group_id
+WHERE {FTS_TABLE} MATCH %s
+  AND p.date_created IS NOT NULL
+  AND g.pending_delete = 0
+  AND (p.is_private = 0 OR EXISTS (
+      SELECT 1 FROM blog_membership m WHERE m.group_id = p.group_id AND m.user_id = %s))
+ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, {TEXT_WEIGHT}), p.id
+LIMIT %s OFFSET %s
+"""
+
+
+def install(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+
+
+def rebuild_index(conn=connection):
+    """Recreate the whole index from the current contents of ``blog_post``."""
+    install(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query matching posts that contain every word,
+    the last one as a prefix. Quoting each word keeps FTS5 operators and
+    punctuation typed by users from being interpreted.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_posts(query, user, page=1, page_size=20):
+    """
+    Return the published posts matching ``query`` that ``user`` may read,
+    best match first, and whether there is a next page.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return [], False
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH, [expression, user.pk, page_size + 1,
+                                (page - 1) * page_size])
+        ids = [row[0] for row in cursor.fetchall()]
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+    posts = Post.objects.select_related('creator', 'group').defer('text').in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts], has_next
@@ -0,0 +1,225 @@
+"""
+A cache backend storing entries in an SQLite file with LRU eviction.
+
+Unlike the locmem cache it is shared by every process on the host, and
+unlike the file cache it evicts the least recently read entries instead of
+random ones. Reads go through Python's ``sqlite3`` module, not Django's
+connections, so cache hits never show up as queries.
+
+Hits don't write: their access times are kept in memory and written in
+one transaction every ``ACCESS_FLUSH_INTERVAL`` seconds and before a
+cull, so concurrent readers never wait on each other for the write lock.
+Errors of the cache database, like a locked file or a full disk, are
+logged and served as misses and failed sets.
+
+OPTIONS:
+
+* ``MAX_ENTRIES``: evict once there are more entries than this (300).
+* ``MAX_SIZE``: evict once the pickled values take more bytes than this
+  (unlimited).
+* ``CULL_FREQUENCY``: evict ``1 / CULL_FREQUENCY`` of the entries past a
+  limit at once, so sets don't evict one entry each, or all of them if 0
+  (3).
+* ``ACCESS_FLUSH_INTERVAL``: write the access times of hits this often, in
+  seconds (5).
+"""
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+
+def fail_safe(default):
+    """Log errors of the cache database and return ``default`` instead."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.Error:
+                logger.warning("SQLite cache %s failed", method.__name__, exc_info=True)
+                return default
+        return wrapper
+    return decorator
+
+
+class SQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        options = params.get('OPTIONS', {})
+        self._max_size = options.get('MAX_SIZE')
+        self._access_flush_interval = options.get('ACCESS_FLUSH_INTERVAL', 5)
+        self.local = threading.local()
+        # {key: time of the last hit} not written to the database yet.
+        self.accessed = {}
+        self.accessed_lock = threading.Lock()
+        self.accessed_flushed = time.time()
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = self.local.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode = wal')
+            db.execute('PRAGMA synchronous = normal')
+            db.executescript(SCHEMA)
+        return db
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        try:
+            # Expired rows are left to the next cull.
+            row = self.db.execute('SELECT value FROM cache WHERE key = ? AND '
+                                  '(expires IS NULL OR expires > ?)', (key, now)).fetchone()
+        except sqlite3.Error:
+            logger.warning("SQLite cache get failed", exc_info=True)
+            return default
+        if row is None:
+            return default
+        self.record_access(key, now)
+        return pickle.loads(row[0])
+
+    def record_access(self, key, now):
+        with self.accessed_lock:
+            self.accessed[key] = now
+            if now - self.accessed_flushed < self._access_flush_interval:
+                return
+        self.flush_access_times()
+
+    @fail_safe(None)
+    def flush_access_times(self):
+        """Write the access times of the hits since the last flush in one transaction."""
+        with self.accessed_lock:
+            accessed, self.accessed = self.accessed, {}
+            self.accessed_flushed = time.time()
+        if not accessed:
+            return
+        db = self.db
+        db.execute('BEGIN')
+        try:
+            # A set after the hit has stored a later time already.
+            db.executemany('UPDATE cache SET accessed = MAX(accessed, ?) WHERE key = ?',
+                           [(when, key) for key, when in accessed.items()])
+            db.execute('COMMIT')
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            raise
+
+    def _store(self, key, value, timeout, replace):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        if not replace:
+            self.db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+        cursor = self.db.execute(
+            f'INSERT OR {"REPLACE" if replace else "IGNORE"} INTO cache '
+            f'(key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, data, len(data), self.get_backend_timeout(timeout), now))
+        if cursor.rowcount:
+            self.cull()
+        return bool(cursor.rowcount)
+
+    @fail_safe(None)
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self._store(key, value, timeout, replace=True)
+
+    @fail_safe(False)
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return self._store(key, value, timeout, replace=False)
+
+    @fail_safe(False)
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        cursor = self.db.execute('UPDATE cache SET expires = ? WHERE key = ?',
+                                 (self.get_backend_timeout(timeout), key))
+        return bool(cursor.rowcount)
+
+    @fail_safe(None)
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self.db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    @fail_safe(False)
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        row = self.db.execute('SELECT 1 FROM cache WHERE key = ? AND '
+                              '(expires IS NULL OR expires > ?)', (key, time.time())).fetchone()
+        return row is not None
+
+    @fail_safe(None)
+    def clear(self):
+        with self.accessed_lock:
+            self.accessed = {}
+        self.db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are kept per thread for the life of the process.
+        pass
+
+    def stats(self):
+        return self.db.execute('SELECT COUNT(*), TOTAL(size) FROM cache').fetchone()
+
+    def over_limits(self, count, size):
+        return (count > self._max_entries or
+                self._max_size is not None and size > self._max_size)
+
+    def cull(self):
+        """Drop expired entries, then the least recently read ones past the limits."""
+        if not self.over_limits(*self.stats()):
+            return
+        self.flush_access_times()
+        db = self.db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count, size = self.stats()
+        if not self.over_limits(count, size):
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+        if count > self._max_entries:
+            db.execute('DELETE FROM cache WHERE key IN '
+                       '(SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                       (count - self._max_entries + count // self._cull_frequency,))
+            count, size = self.stats()
+        if self._max_size is not None and size > self._max_size:
+            # The oldest entries whose sizes add up to the excess plus
+            # 1 / CULL_FREQUENCY of MAX_SIZE.
+            target = size - self._max_size + self._max_size // self._cull_frequency
+            db.execute("""
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed, key) - size AS before
+                        FROM cache)
+                    WHERE before < ?)
+            """, (target,))
@@ -0,0 +1,28 @@
+from django.db import transaction
+
+from . import search
+from .models import Group, Post, TimelineEntry
+from .queue import task
+
+
+@task
+def purge_group(group_id):
+    group = Group.all_objects.filter(pk=group_id, pending_delete=True).first()
+    if group is not None:
+        group.purge()
+
+
+@task
+def fan_out_posts(post_ids):
+    TimelineEntry.fan_out_many(Post.objects.published().filter(pk__in=post_ids))
+
+
+@task
+def rebuild_group_counters():
+    with transaction.atomic():
+        Group.objects.rebuild_counters()
+
+
+@task
+def rebuild_search_index():
+    search.rebuild_index()
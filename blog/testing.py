@@ -0,0 +1,72 @@
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+# The settings AUTH_CACHE_ENABLED turns on, for tests counting queries.
+with_auth_cache = override_settings(
+    AUTHENTICATION_BACKENDS=['blog.auth.CachedModelBackend'],
+    SESSION_ENGINE='blog.auth',
+    SESSION_CACHE_ALIAS=settings.AUTH_CACHE_ALIAS,
+)
+
+# Most SQL statements a GET of each route may run for a logged-in user,
+# whatever the amount of data, once the auth cache holds their session and
+# user (see with_auth_cache). A cold cache adds up to two lookups.
+QUERY_BUDGETS = {
+    'home_page': 0,
+    'login': 0,
+    'registration': 0,
+    'group_list': 2,
+    'group_trending': 1,
+    'group_create': 0,
+    'group_info': 3,
+    'group_update': 1,
+    'post_create': 2,
+    'post_list': 1,
+    'post_info': 1,
+    'post_popular': 1,
+    'post_update': 1,
+    'drafts_list': 1,
+    'post_search': 2,
+    'my_feed': 2,
+}
+
+
+def format_queries(queries):
+    return '\n'.join(f"{number}. {query['sql']}"
+                     for number, query in enumerate(queries, start=1))
+
+
+class QueryBudgetMixin:
+    """TestCase mixin checking views against :data:`QUERY_BUDGETS`."""
+
+    def assertWithinBudget(self, url_name, budget, queries):
+        if len(queries) > budget:
+            self.fail(f"{url_name} ran {len(queries)} queries, its budget is "
+                      f"{budget}:\n{format_queries(queries)}")
+
+    def assertQueryBudget(self, url_name, client=None, data=None, **kwargs):
+        """GET ``url_name`` and fail with the captured SQL if it goes over budget."""
+        url = reverse(url_name, kwargs=kwargs)
+        with CaptureQueriesContext(connection) as captured:
+            response = (client or self.client).get(url, data)
+        self.assertWithinBudget(url_name, QUERY_BUDGETS[url_name], captured.captured_queries)
+        return response
+
+
+def query_budget(url_name, budget=None):
+    """Fail the decorated test if its body runs more queries than the budget."""
+    def decorator(test):
+        @wraps(test)
+        def wrapper(self, *args, **kwargs):
+            with CaptureQueriesContext(connection) as captured:
+                result = test(self, *args, **kwargs)
+            limit = QUERY_BUDGETS[url_name] if budget is None else budget
+            QueryBudgetMixin.assertWithinBudget(self, url_name, limit,
+                                                captured.captured_queries)
+            return result
+        return wrapper
+    return decorator
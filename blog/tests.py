@@ -1,12 +1,44 @@
-from django.test import TestCase, Client, RequestFactory
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import resolve, reverse
-from django.contrib.auth.models import User
-from django.http import HttpRequest
-from .models import Group, Post, Membership
+from django.contrib.auth.models import User, AnonymousUser
+from django.contrib.sessions.models import Session
+from django.http import HttpRequest, HttpResponse
+from .models import (EXCERPT_LENGTH, ArchivedPost, Group, GroupTrend, Post, Membership,
+                     Task, TimelineEntry)
+from .auth import user_cache, user_cache_key
+from .middleware import ReplicaMiddleware
+from .permissions import Access
+from .page_cache import CSRF_PLACEHOLDER, page_cache
+from .pagination import after_cursor, encode_cursor
+from . import counters, metrics, queue, trending
+from .queue import run_due_tasks, task
+from .sqlite_cache import SQLiteCache
+from .routers import PrimaryReplicaRouter, reads_from_replica, state
+from .testing import (QUERY_BUDGETS, QueryBudgetMixin, format_queries, query_budget,
+                      with_auth_cache)
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from django.utils import timezone
-from . import views
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Count
+from .management.commands.sync_replica import copy_database
+from io import StringIO
+from django.core.handlers.wsgi import WSGIHandler
+from project2.asgi import WsgiToAsgi
+import asyncio
+from . import urls, views
+import json
+import math
+import os
+import re
+import tempfile
+import time
+import sqlite3
 import unittest
+from unittest import mock
 
 LOGIN_USER_DATA = {'username': 'test',
                    'email': 'test@test.com',
@@ -43,6 +75,14 @@ CREATE_POST_DATA = {'title':'create new post',
                  'text': 'this is a test text'}
 UPDATE_POST_DATA = {'title': 'update title',
                     'text': 'this is updated text'}
+
+
+def query_plan(queryset):
+    """The steps of SQLite's EXPLAIN QUERY PLAN of ``queryset``, in one string."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return ' | '.join(row[-1] for row in cursor.fetchall())
 # Create your tests here.
 class HomePageTest(TestCase):
 
@@ -51,6 +91,7 @@ class HomePageTest(TestCase):
         self.assertEqual(found_view.func, views.home_page)
 
     def test_home_page_returns_correct_template(self):
+        page_cache().clear()
         client = Client()
         response = client.get('/')
         self.assertTemplateUsed(response, 'homepage.html')
@@ -60,6 +101,7 @@ class HomePageTest(TestCase):
 class LoginPageTest(TestCase):
 
     def setUp(self):
+        page_cache().clear()
         self.client = Client()
         self.user = User.objects.create_user(**LOGIN_USER_DATA)
         self.login_error = settings.LOGIN_ERROR_MESSAGE.encode('utf-8')
@@ -111,6 +153,7 @@ class RegistrationPageTest(TestCase):
         self.assertEqual(found_view.func, views.user_registration)
 
     def test_registration_page_returns_correct_template(self):
+        page_cache().clear()
         response = self.client.get('/register/')
         self.assertTemplateUsed(response, 'registration.html')
         self.assertEqual(response.status_code, 200)
@@ -247,6 +290,38 @@ class PostTest(TestCase):
         self.assertTemplateUsed(response, 'posts/posts_list.html')
         self.assertEqual(response.status_code, 200)
 
+    def test_posts_list_shows_only_published_public_posts(self):
+        published = Post.objects.create(**NEW_POST_DATA, date_created=timezone.now())
+        Post.objects.create(**NEW_POST_DATA, date_created=timezone.now(),
+                            is_private=True)
+        response = self.client.get('/posts/')
+        self.assertEqual(list(response.context['post_list']), [published])
+
+    @override_settings(POSTS_PAGE_SIZE=2)
+    def test_posts_list_pages_with_cursor(self):
+        now = timezone.now()
+        posts = [Post.objects.create(**NEW_POST_DATA, date_created=now)
+                 for _ in range(3)]
+        response = self.client.get('/posts/')
+        self.assertEqual(list(response.context['post_list']), posts[:0:-1])
+        cursor = response.context['next_cursor']
+        response = self.client.get('/posts/', {'after': cursor})
+        self.assertEqual(list(response.context['post_list']), [posts[0]])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_posts_list_cursor_seeks_the_feed_index(self):
+        cursor = encode_cursor(timezone.now(), self.post.pk)
+        for user in (self.user, AnonymousUser()):
+            posts = after_cursor(Post.objects.published().visible_to(user), cursor)
+            plan = query_plan(posts[:settings.POSTS_PAGE_SIZE + 1])
+            self.assertIn('SEARCH blog_post USING INDEX post_feed_idx (date_created>? AND '
+                          'date_created<?)', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_posts_list_with_invalid_cursor(self):
+        response = self.client.get('/posts/', {'after': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+
     def test_post_info_url_resolves_to_PostInfo_view(self):
         found_view = resolve(f'/posts/{self.post.pk}')
         self.assertEqual(found_view.url_name, 'post_info')
@@ -346,3 +421,1642 @@ class DraftTest(TestCase):
         posted = Post.objects.get(pk=draft.pk)
         self.assertIsNotNone(posted.date_created)
         self.assertRedirects(response, '/drafts/')
+
+
+class ExcerptTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        self.post = Post.objects.create(title='long', text='word\n' * 1000, creator=self.user,
+                                        group=self.group, date_created=timezone.now())
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+        del self.post
+
+    def test_save_stores_excerpt_and_word_count(self):
+        self.assertEqual(self.post.word_count, 1000)
+        self.assertLessEqual(len(self.post.excerpt), EXCERPT_LENGTH)
+        self.assertTrue(self.post.excerpt.startswith('word word'))
+        self.post.text = 'short text'
+        self.post.save(update_fields=['text'])
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.excerpt, self.post.word_count), ('short text', 2))
+
+    def test_lists_do_not_load_post_bodies(self):
+        Post.objects.create(title='draft', text='draft text', creator=self.user,
+                            group=self.group)
+        for url in ('/posts/', f'/groups/{self.group.pk}/', '/drafts/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('"blog_post"."text"', format_queries(captured.captured_queries))
+            self.assertNotContains(response, 'word\nword')
+
+    def test_post_page_shows_whole_text(self):
+        response = self.client.get(f'/posts/{self.post.pk}')
+        self.assertContains(response, 'word\n' * 1000)
+
+
+class ScheduleTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.reader = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        Membership.create(self.user, self.group)
+        Membership.create(self.reader, self.group)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.reader
+        del self.group
+
+    def schedule(self, title, delay):
+        return Post.objects.create(title=title, text='text', creator=self.user, group=self.group,
+                                   publish_at=timezone.now() + timezone.timedelta(minutes=delay))
+
+    def test_post_can_be_scheduled_from_form(self):
+        self.client.post(f'/groups/{self.group.pk}/new_post/',
+                         data={'title': 'later', 'text': 'text',
+                               'publish_at': '2030-01-01T12:00'})
+        post = Post.objects.get(title='later')
+        self.assertIsNone(post.date_created)
+        self.assertEqual(timezone.localtime(post.publish_at).hour, 12)
+        self.assertContains(self.client.get('/drafts/'), 'Scheduled for')
+
+    def test_invalid_publication_time_is_rejected(self):
+        for value in ('2026-02-30T10:00', 'tomorrow'):
+            response = self.client.post(f'/groups/{self.group.pk}/new_post/',
+                                        data={'title': 'typo', 'text': 'text',
+                                              'publish_at': value})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.filter(title='typo').exists())
+
+    def test_scheduler_publishes_due_posts_in_one_batch(self):
+        due = [self.schedule(f'due {i}', -i) for i in range(3)]
+        later = self.schedule('later', 60)
+        out = StringIO()
+        call_command('run_scheduler', once=True, batch_size=2, stdout=out)
+        self.assertIn('Published 3 posts', out.getvalue())
+        for post in due:
+            post.refresh_from_db()
+            self.assertIsNotNone(post.date_created)
+            self.assertIsNone(post.publish_at)
+        later.refresh_from_db()
+        self.assertIsNone(later.date_created)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 3)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(Post.objects.next_due(), later.publish_at)
+
+    def test_publishing_twice_counts_once(self):
+        post = self.schedule('due', -1)
+        self.assertEqual(Post.objects.filter(pk=post.pk).publish(), 1)
+        self.assertEqual(Post.objects.filter(pk=post.pk).publish(), 0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+
+    def test_due_posts_are_found_from_index(self):
+        self.assertIn('post_publish_at_idx', Post.objects.due(timezone.now()).explain())
+
+
+class InviteTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(name='team', theme='GE', creator=self.user)
+        self.group.is_private = True
+        self.group.save()
+        Membership.create(self.user, self.group)
+        Post.objects.create(title='welcome', text='text', creator=self.user, group=self.group,
+                            date_created=timezone.now())
+        User.objects.bulk_create(User(username=f'member{i}') for i in range(60))
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+
+    def test_invite_reports_each_kind_of_username(self):
+        response = self.client.post(f'/groups/{self.group.pk}/invite/',
+                                    {'invited_user': 'member1, member2\ntest\nnobody'})
+        self.assertContains(response, 'Invited: member1, member2. Already members: test. '
+                                      'Unknown users: nobody')
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 3)
+        self.assertEqual(TimelineEntry.objects.filter(user__username='member2').count(), 1)
+
+    def test_invite_query_count_does_not_grow_with_usernames(self):
+        def queries(usernames):
+            with CaptureQueriesContext(connection) as captured:
+                Membership.invite(self.group, usernames)
+            return len(captured)
+        few = queries([f'member{i}' for i in range(5)])
+        many = queries([f'member{i}' for i in range(5, 60)])
+        self.assertEqual(few, many)
+
+    def test_membership_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Membership.objects.create(user=self.user, group=self.group,
+                                      date_joined=timezone.now())
+
+    def test_joining_twice_keeps_one_membership(self):
+        member = User.objects.get(username='member1')
+        first = Membership.create(member, self.group)
+        self.assertEqual(Membership.create(member, self.group), first)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 2)
+
+    def test_invite_skips_users_who_joined_meanwhile(self):
+        member = User.objects.get(username='member1')
+        bulk_create = Membership.objects.bulk_create
+
+        def join_first(memberships, **kwargs):
+            Membership.objects.create(user=member, group=self.group, date_joined=timezone.now())
+            return bulk_create(memberships, **kwargs)
+        with mock.patch.object(Membership.objects, 'bulk_create', join_first):
+            report = Membership.invite(self.group, ['member1', 'member2'])
+        self.assertEqual(report.invited, ['member2'])
+        self.assertEqual(report.already_members, ['member1'])
+        self.assertFalse(TimelineEntry.objects.filter(user=member).exists())
+        self.assertTrue(TimelineEntry.objects.filter(user__username='member2').exists())
+
+    def test_invite_members_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('invite_members', self.group.pk, 'member3', 'ghost', stdout=out, stderr=err)
+        self.assertIn('Invited 1 users', out.getvalue())
+        self.assertIn('Unknown users: ghost', err.getvalue())
+        self.assertTrue(self.group.members.filter(username='member3').exists())
+
+
+class GroupPurgeTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(name='doomed', theme='GE', creator=self.user)
+        self.kept = Group.create(name='kept', theme='GE', creator=self.user)
+        for group in (self.group, self.kept):
+            Membership.create(self.user, group)
+            Membership.create(self.other, group)
+            for i in range(12):
+                Post.objects.create(title=f'{group.name} {i}', text='text', creator=self.user,
+                                    group=group, date_created=timezone.now()).on_publish()
+        run_due_tasks()
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.other
+        del self.group
+        del self.kept
+
+    def test_deleted_group_is_hidden_at_once(self):
+        post = Post.objects.filter(group=self.group).first()
+        response = self.client.post(f'/groups/{self.group.pk}/delete/')
+        self.assertRedirects(response, '/groups/')
+        self.assertTrue(Group.all_objects.filter(pk=self.group.pk, pending_delete=True).exists())
+        self.assertEqual(list(Group.objects.all()), [self.kept])
+        self.assertEqual(self.client.get(f'/groups/{self.group.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/posts/{post.pk}').status_code, 404)
+        self.assertNotContains(self.client.get('/posts/'), 'doomed')
+        self.assertNotContains(self.client.get('/feed/'), 'doomed')
+        self.assertEqual(self.client.get('/posts/search/', {'q': 'doomed'}).context['posts'], [])
+
+    def test_purge_deletes_children_in_batches(self):
+        self.group.mark_deleted()
+        out = StringIO()
+        call_command('purge_deleted_groups', batch_size=10, stdout=out)
+        self.assertIn('deleted 10 posts', out.getvalue())
+        self.assertIn('deleted 12 posts', out.getvalue())
+        self.assertIn('Purged 1 groups', out.getvalue())
+        self.assertFalse(Group.all_objects.filter(pk=self.group.pk).exists())
+        self.assertFalse(Post.objects.filter(group_id=self.group.pk).exists())
+        self.assertFalse(Membership.objects.filter(group_id=self.group.pk).exists())
+        self.assertFalse(TimelineEntry.objects.filter(group_id=self.group.pk).exists())
+        self.assertEqual(Post.objects.filter(group=self.kept).count(), 12)
+        self.assertEqual(TimelineEntry.objects.filter(group=self.kept).count(), 24)
+
+
+CALLS = []
+
+
+@task
+def record_call(value):
+    CALLS.append(value)
+
+
+@task(max_attempts=2)
+def always_fail():
+    raise ValueError("broken")
+
+
+class QueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_queued_task_runs_once(self):
+        record_call.delay(1)
+        self.assertEqual(CALLS, [])
+        self.assertEqual(run_due_tasks(), 1)
+        self.assertEqual(CALLS, [1])
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(run_due_tasks(), 0)
+
+    def test_failed_task_is_retried_with_backoff_then_given_up(self):
+        queued = always_fail.delay()
+        before = timezone.now()
+        with self.assertLogs('blog.queue', 'ERROR'):
+            run_due_tasks()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreaterEqual(queued.run_at, before + timezone.timedelta(
+            seconds=settings.TASK_RETRY_DELAY))
+        self.assertIn('ValueError: broken', queued.last_error)
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('blog.queue', 'ERROR'):
+            run_due_tasks()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_claimed_task_is_hidden_until_visibility_timeout(self):
+        record_call.delay(2)
+        [claimed] = queue.claim(10)
+        self.assertEqual(queue.claim(10), [])
+        Task.objects.update(run_at=timezone.now())
+        [reclaimed] = queue.claim(10)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (claimed.pk, 2))
+        self.assertTrue(queue.run(reclaimed))
+        self.assertEqual(CALLS, [2])
+
+    def test_group_delete_hands_purge_to_worker(self):
+        user = User.objects.create_user(**LOGIN_USER_DATA)
+        client = Client()
+        client.login(username='test', password='test123')
+        group = Group.create(name='big', theme='GE', creator=user)
+        client.post(f'/groups/{group.pk}/delete/')
+        self.assertTrue(Group.all_objects.filter(pk=group.pk).exists())
+        run_due_tasks()
+        self.assertFalse(Group.all_objects.filter(pk=group.pk).exists())
+
+
+class WorkerCommandTest(TransactionTestCase):
+
+    def test_worker_runs_due_tasks_on_thread_pool(self):
+        CALLS.clear()
+        for value in range(5):
+            record_call.delay(value)
+        out = StringIO()
+        call_command('run_worker', concurrency=3, once=True, stdout=out)
+        self.assertEqual(sorted(CALLS), list(range(5)))
+        self.assertEqual(out.getvalue().count(' done '), 5)
+        self.assertFalse(Task.objects.exists())
+
+
+@with_auth_cache
+class GroupCounterTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+
+    def test_join_and_leave_update_member_count(self):
+        self.client.post(f'/groups/{self.group.pk}/')
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 1)
+        self.client.post(f'/groups/{self.group.pk}/')
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 0)
+
+    def test_publishing_and_deleting_posts_update_post_counters(self):
+        Membership.create(self.user, self.group)
+        self.client.post(f'/groups/{self.group.pk}/new_post/', data=CREATE_POST_DATA)
+        post = Post.objects.get(title=CREATE_POST_DATA['title'])
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.group.last_post_at, post.date_created)
+        self.client.post(f'/posts/{post.pk}/delete/')
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.assertIsNone(self.group.last_post_at)
+
+    def test_drafts_are_counted_when_published(self):
+        draft = Post.create(title='draft', text='text', creator=self.user,
+                            group=self.group)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        self.client.post(f'/posts/{draft.pk}/publish/')
+        self.client.post(f'/posts/{draft.pk}/publish/')
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 1)
+
+    def test_rebuild_group_counters_command(self):
+        Membership.objects.create(user=self.user, group=self.group,
+                                  date_joined=timezone.now())
+        Post.objects.create(title='t', text='t', creator=self.user,
+                            group=self.group, date_created=timezone.now())
+        call_command('rebuild_group_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.member_count, 1)
+        self.assertEqual(self.group.post_count, 1)
+
+    def test_groups_list_query_count_does_not_grow_with_groups(self):
+        for i in range(5):
+            Group.create(name=f'group {i}', theme='GE', creator=self.user)
+        self.client.get('/groups/')
+        # The page; the theme counts were cached by the first request.
+        with self.assertNumQueries(1):
+            self.client.get('/groups/')
+
+
+@with_auth_cache
+class AccessTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        self.other_group = Group.create(**CREATE_GROUP_DATA, creator=self.other)
+        Membership.create(self.user, self.group)
+
+    def test_checks_are_answered_from_one_query(self):
+        access = Access(self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(access.is_member(self.group))
+            self.assertFalse(access.is_member(self.other_group))
+            self.assertTrue(access.can_post(self.group))
+            self.assertTrue(access.is_creator(self.group))
+            self.assertFalse(access.is_creator(self.other_group))
+
+    def test_anonymous_user_has_no_access(self):
+        access = Access(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(access.is_member(self.group))
+            self.assertFalse(access.is_creator(self.group))
+
+    def test_group_page_runs_membership_check_once(self):
+        client = Client()
+        client.login(username='test', password='test123')
+        client.get('/')
+        with self.assertNumQueries(3):
+            response = client.get(f'/groups/{self.group.pk}/')
+        self.assertTrue(response.context['is_member'])
+        self.assertTrue(response.context['is_creator'])
+
+
+@with_auth_cache
+class AuthCacheTest(TestCase):
+    def setUp(self):
+        # These check the context of anonymous pages, so they must render.
+        page_cache().clear()
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.client.get('/')
+
+    def tearDown(self):
+        user_cache().clear()
+        del self.client
+        del self.user
+
+    def test_warm_request_runs_no_auth_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/')
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_saving_user_drops_cached_copy(self):
+        self.user.set_password('changed123')
+        self.user.save()
+        self.assertIsNone(user_cache().get(user_cache_key(self.user.pk)))
+        response = self.client.get('/')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_sessions_ended_elsewhere_expire_from_the_cache(self):
+        # Another process logs the user out: only the database changes here.
+        Session.objects.all().delete()
+        self.assertTrue(self.client.get('/').context['user'].is_authenticated)
+        later = time.time() + settings.AUTH_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time') as clock:
+            clock.time.return_value = later
+            response = self.client.get('/')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_logout_drops_cached_user(self):
+        self.client.get('/logout/')
+        self.assertIsNone(user_cache().get(user_cache_key(self.user.pk)))
+        response = self.client.get('/')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+
+class BenchmarkCommandTest(TestCase):
+
+    def test_seed_benchmark_creates_skewed_data(self):
+        call_command('seed_benchmark', users=30, groups=10, posts=200,
+                     stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        sizes = list(Group.objects.order_by('-member_count')
+                     .values_list('member_count', flat=True))
+        self.assertGreater(sizes[0], sizes[-1])
+        self.assertEqual(Post.objects.filter(group__is_private=True, is_private=False).count(), 0)
+
+    def test_bench_reports_every_route(self):
+        call_command('seed_benchmark', users=30, groups=10, posts=200,
+                     stdout=StringIO())
+        out = StringIO()
+        call_command('bench', iterations=3, stdout=out)
+        report = json.loads(out.getvalue())
+        endpoints = report['endpoints']
+        self.assertEqual(set(endpoints), {pattern.name for pattern in urls.urlpatterns})
+        for name in ('group_list', 'group_info', 'post_list', 'post_info'):
+            self.assertEqual(endpoints[name]['status'], 200)
+            self.assertGreater(endpoints[name]['queries'], 0)
+            self.assertLessEqual(endpoints[name]['p50_ms'], endpoints[name]['p99_ms'])
+
+
+class AsgiTest(TestCase):
+    def setUp(self):
+        self.application = WsgiToAsgi(WSGIHandler(), threads=2)
+
+    def tearDown(self):
+        self.application.executor.shutdown()
+        del self.application
+
+    def call(self, scope, messages):
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+        asyncio.run(self.application(scope, receive, send))
+        return sent
+
+    def test_http_request_runs_through_wsgi_handler(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+                 'headers': [(b'host', b'testserver'), (b'accept', b'text/html')]}
+        start, body = self.call(scope, [{'type': 'http.request', 'body': b''}])
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'x-frame-options', b'SAMEORIGIN'), start['headers'])
+        self.assertIn(b'Welcome!', body['body'])
+
+    def test_environ_joins_repeated_headers(self):
+        scope = {'type': 'http', 'method': 'POST', 'path': '/login/',
+                 'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                             (b'content-type', b'text/plain')]}
+        environ = WsgiToAsgi.environ(scope, b'body')
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['wsgi.input'].read(), b'body')
+
+    def test_lifespan(self):
+        sent = self.call({'type': 'lifespan'}, [{'type': 'lifespan.startup'},
+                                                {'type': 'lifespan.shutdown'}])
+        self.assertEqual([message['type'] for message in sent],
+                         ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    def test_lifespan_callbacks(self):
+        calls = []
+        self.application.on_startup = [lambda: calls.append('startup')]
+        self.application.on_shutdown = [lambda: calls.append('shutdown')]
+        self.call({'type': 'lifespan'}, [{'type': 'lifespan.startup'},
+                                         {'type': 'lifespan.shutdown'}])
+        self.assertEqual(calls, ['startup', 'shutdown'])
+
+
+@with_auth_cache
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        Membership.create(self.user, self.group)
+        self.post = Post.objects.create(title='post', text='text', creator=self.user,
+                                        group=self.group, date_created=timezone.now())
+        Post.objects.create(title='draft', text='text', creator=self.user, group=self.group)
+        self.client.get('/')
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+        del self.post
+
+    def populate(self, rows):
+        User.objects.bulk_create(User(username=f'budget {i}') for i in range(rows))
+        users = list(User.objects.filter(username__startswith='budget '))
+        Group.objects.bulk_create(Group(name=f'group {i}', theme='GE', creator=user)
+                                  for i, user in enumerate(users))
+        groups = list(Group.objects.filter(name__startswith='group '))
+        Membership.objects.bulk_create(
+            Membership(user=user, group=group, date_joined=timezone.now())
+            for user in [self.user] + users for group in groups[:1])
+        Membership.objects.bulk_create(
+            Membership(user=self.user, group=group, date_joined=timezone.now())
+            for group in groups[1:])
+        Post.objects.bulk_create(
+            Post(title=f'post {i}', text='text', creator=user, group=self.group,
+                 date_created=timezone.now())
+            for i, user in enumerate(users))
+        Post.objects.bulk_create(
+            Post(title=f'draft {i}', text='text', creator=self.user, group=group)
+            for i, group in enumerate(groups))
+        Group.objects.rebuild_counters()
+
+    def check_budgets(self):
+        kwargs = {'group_info': {'group_id': self.group.pk},
+                  'group_update': {'group_id': self.group.pk},
+                  'post_create': {'group_id': self.group.pk},
+                  'post_info': {'pk': self.post.pk},
+                  'post_update': {'post_id': self.post.pk}}
+        data = {'post_search': {'q': 'post'}}
+        for url_name in QUERY_BUDGETS:
+            with self.subTest(url_name=url_name):
+                response = self.assertQueryBudget(url_name, data=data.get(url_name),
+                                                  **kwargs.get(url_name, {}))
+                self.assertEqual(response.status_code, 200)
+
+    def test_budgets_hold_with_one_row(self):
+        self.check_budgets()
+
+    def test_budgets_hold_with_500_rows(self):
+        self.populate(500)
+        self.check_budgets()
+
+    @query_budget('group_list')
+    def test_query_budget_decorator(self):
+        self.client.get('/groups/')
+
+    def test_exceeding_budget_fails_with_captured_sql(self):
+        with self.assertRaisesMessage(AssertionError, 'group_list ran 2 queries'):
+            query_budget('group_list', budget=0)(
+                lambda test: test.client.get('/groups/'))(self)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        self.private_group = Group.objects.create(name='private', theme='GE',
+                                                  creator=self.user, is_private=True)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+        del self.private_group
+
+    def create_post(self, title, text, group=None, published=True):
+        group = group or self.group
+        return Post.objects.create(title=title, text=text, creator=self.user, group=group,
+                                   is_private=group.is_private,
+                                   date_created=timezone.now() if published else None)
+
+    def search(self, query, **params):
+        response = self.client.get('/posts/search/', {'q': query, **params})
+        self.assertTemplateUsed(response, 'posts/search_results.html')
+        return response.context['posts']
+
+    def test_search_url_resolves_to_PostSearch_view(self):
+        found_view = resolve('/posts/search/')
+        self.assertEqual(found_view.url_name, 'post_search')
+
+    def test_search_ranks_title_matches_first(self):
+        in_text = self.create_post('first', 'about django and sqlite')
+        in_title = self.create_post('django tips', 'nothing else')
+        self.create_post('unrelated', 'nothing here')
+        self.assertEqual(self.search('django'), [in_title, in_text])
+
+    def test_search_matches_word_prefixes(self):
+        post = self.create_post('searching', 'full text')
+        self.assertEqual(self.search('sear'), [post])
+
+    def test_search_skips_drafts_and_private_posts_of_other_groups(self):
+        self.create_post('draft django', 'text', published=False)
+        private = self.create_post('private django', 'text', group=self.private_group)
+        self.assertEqual(self.search('django'), [])
+        Membership.create(self.user, self.private_group)
+        self.assertEqual(self.search('django'), [private])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = self.create_post('old title', 'text')
+        post.title = 'new title'
+        post.save()
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), [post])
+        post.delete()
+        self.assertEqual(self.search('new'), [])
+
+    @override_settings(POSTS_PAGE_SIZE=2)
+    def test_search_is_paginated(self):
+        for i in range(3):
+            self.create_post(f'post {i}', 'paged')
+        self.assertEqual(len(self.search('paged')), 2)
+        response = self.client.get('/posts/search/', {'q': 'paged', 'page': 2})
+        self.assertEqual(len(response.context['posts']), 1)
+        self.assertFalse(response.context['has_next'])
+
+    def test_search_ignores_fts_syntax(self):
+        self.create_post('quotes', 'text')
+        self.assertEqual(self.search('"quo AND NOT ('), [])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_rebuild_search_index_command(self):
+        post = self.create_post('rebuilt', 'text')
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO blog_post_fts(blog_post_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search('rebuilt'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('rebuilt'), [post])
+
+
+@with_auth_cache
+class FeedTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.author = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.author_client = Client()
+        self.author_client.login(username='new user', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.author)
+        Membership.create(self.author, self.group)
+
+    def tearDown(self):
+        del self.client
+        del self.author_client
+        del self.user
+        del self.author
+        del self.group
+
+    def publish(self, title, group=None):
+        group = group or self.group
+        self.author_client.post(f'/groups/{group.pk}/new_post/',
+                                data={'title': title, 'text': 'text'})
+        run_due_tasks()
+        return Post.objects.get(title=title)
+
+    def feed(self, **params):
+        response = self.client.get('/feed/', params)
+        self.assertTemplateUsed(response, 'posts/feed.html')
+        return response.context['posts']
+
+    def test_feed_url_resolves_to_Feed_view(self):
+        found_view = resolve('/feed/')
+        self.assertEqual(found_view.url_name, 'my_feed')
+
+    def test_published_posts_are_fanned_out_to_members(self):
+        Membership.create(self.user, self.group)
+        post = self.publish('fanned out')
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+    def test_drafts_reach_the_feed_when_published(self):
+        Membership.create(self.user, self.group)
+        self.author_client.post(f'/groups/{self.group.pk}/new_post/',
+                                data={'title': 'draft', 'text': 'text', 'publish': 'on'})
+        draft = Post.objects.get(title='draft')
+        self.assertEqual(self.feed(), [])
+        self.author_client.post(f'/posts/{draft.pk}/publish/')
+        run_due_tasks()
+        self.assertEqual(self.feed(), [draft])
+
+    def test_joining_backfills_and_leaving_clears_the_timeline(self):
+        post = self.publish('before joining')
+        self.client.post(f'/groups/{self.group.pk}/')
+        self.assertEqual(self.feed(), [post])
+        self.client.post(f'/groups/{self.group.pk}/')
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(POSTS_PAGE_SIZE=2, TIMELINE_FANOUT_LIMIT=2)
+    def test_large_groups_are_merged_on_read(self):
+        large = Group.create(name='large', theme='GE', creator=self.author)
+        for user in (self.user, self.author, User.objects.create_user('third')):
+            Membership.create(user, large)
+        Membership.create(self.user, self.group)
+        posts = [self.publish('small 1'), self.publish('large 1', large),
+                 self.publish('small 2'), self.publish('large 2', large)]
+        self.assertFalse(TimelineEntry.objects.filter(group=large).exists())
+        response = self.client.get('/feed/')
+        self.assertEqual(response.context['posts'], posts[:1:-1])
+        response = self.client.get('/feed/', {'after': response.context['next_cursor']})
+        self.assertEqual(response.context['posts'], posts[1::-1])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_feed_query_count_does_not_grow_with_groups(self):
+        for i in range(10):
+            group = Group.create(name=f'group {i}', theme='GE', creator=self.author)
+            Membership.create(self.author, group)
+            Membership.create(self.user, group)
+            self.publish(f'post {i}', group)
+        self.client.get('/')
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.feed()), 10)
+
+    def test_fill_copies_existing_posts(self):
+        Membership.create(self.user, self.group)
+        post = Post.objects.create(title='bulk', text='text', creator=self.author,
+                                   group=self.group, date_created=timezone.now())
+        self.assertEqual(self.feed(), [])
+        TimelineEntry.fill(Group.objects.filter(pk=self.group.pk))
+        self.assertEqual(self.feed(), [post])
+
+
+class JsonlTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.member = User.objects.create_user(**NEW_USER_DATA)
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        Membership.create(self.member, self.group)
+        self.post = Post.objects.create(title='exported', text='text', creator=self.member,
+                                        group=self.group, date_created=timezone.now())
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'dump.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+        del self.user
+        del self.member
+        del self.group
+        del self.post
+
+    def export(self):
+        call_command('export_jsonl', self.path, chunk_size=1, stderr=StringIO())
+        with open(self.path) as dump:
+            return [json.loads(line) for line in dump]
+
+    def test_export_writes_referenced_records_first(self):
+        types = [record['type'] for record in self.export()]
+        self.assertEqual(types, ['user', 'user', 'group', 'membership', 'post'])
+
+    def test_import_round_trip(self):
+        self.export()
+        call_command('import_jsonl', self.path, batch_size=1, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+        group = Group.objects.exclude(pk=self.group.pk).get()
+        self.assertEqual(group.name, self.group.name)
+        self.assertEqual(group.creator, self.user)
+        self.assertEqual(group.member_count, 1)
+        self.assertEqual(group.post_count, 1)
+        post = Post.objects.get(group=group)
+        self.assertEqual((post.title, post.creator), ('exported', self.member))
+        self.assertTrue(TimelineEntry.objects.filter(user=self.member, post=post).exists())
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+    def test_round_trip_leaves_out_groups_pending_delete(self):
+        # The pending group has the highest id, which the import must not reuse.
+        pending = Group.create(name='pending', theme='GE', creator=self.user)
+        Membership.create(self.member, pending)
+        Post.objects.create(title='gone', text='text', creator=self.member, group=pending,
+                            date_created=timezone.now())
+        pending.mark_deleted()
+        types = [record['type'] for record in self.export()]
+        self.assertEqual(types, ['user', 'user', 'group', 'membership', 'post'])
+        call_command('import_jsonl', self.path, stdout=StringIO())
+        group = Group.objects.exclude(pk=self.group.pk).get()
+        self.assertGreater(group.pk, pending.pk)
+        self.assertEqual(list(Post.objects.filter(group=group).values_list('title', flat=True)),
+                         ['exported'])
+        self.assertEqual(Post.objects.filter(group=pending).count(), 1)
+
+    def test_dumpdata_includes_groups_pending_delete(self):
+        self.group.mark_deleted()
+        output = StringIO()
+        call_command('dumpdata', 'blog.group', stdout=output)
+        self.assertEqual([row['pk'] for row in json.loads(output.getvalue())], [self.group.pk])
+
+    def test_import_resumes_after_failure(self):
+        records = self.export()
+        with open(self.path, 'w') as dump:
+            for record in records[:4] + [{**records[4], 'group': 404}]:
+                dump.write(json.dumps(record) + '\n')
+        with self.assertRaisesMessage(CommandError, 'Unknown group id 404'):
+            call_command('import_jsonl', self.path, stdout=StringIO())
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 1)
+        # The checkpoint holds a position; the id maps are in the log.
+        with open(f'{self.path}.checkpoint') as checkpoint:
+            state = json.load(checkpoint)
+        self.assertEqual((state['line'], 'ids' in state), (4, False))
+        with open(f'{self.path}.checkpoint.ids') as id_log:
+            self.assertEqual(len(id_log.readlines()), 3)
+
+        with open(self.path, 'w') as dump:
+            for record in records:
+                dump.write(json.dumps(record) + '\n')
+        call_command('import_jsonl', self.path, resume=True, stdout=StringIO())
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Membership.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 2)
+
+
+@with_auth_cache
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(**NEW_GROUP_DATA, creator=self.user)
+        Membership.create(self.user, self.group)
+        self.post = Post.objects.create(title='post', text='text', creator=self.user,
+                                        group=self.group, date_created=timezone.now())
+        self.client.get('/')
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.group
+        del self.post
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_group_page_answers_304_without_rendering(self):
+        url = f'/groups/{self.group.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(2):
+            response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, 'groups/group_info.html')
+
+    def test_group_page_changes_with_new_posts(self):
+        url = f'/groups/{self.group.pk}/'
+        response = self.client.get(url)
+        self.client.post(f'/groups/{self.group.pk}/new_post/',
+                         data={'title': 'new', 'text': 'text'})
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_group_page_changes_with_membership(self):
+        url = f'/groups/{self.group.pk}/'
+        response = self.client.get(url)
+        self.client.post(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_post_page_answers_304_until_updated(self):
+        url = f'/posts/{self.post.pk}'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.client.post(f'/posts/{self.post.pk}/update/', data=UPDATE_POST_DATA)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_validators_are_per_user(self):
+        url = f'/posts/{self.post.pk}'
+        response = self.client.get(url)
+        User.objects.create_user(**NEW_USER_DATA)
+        other = Client()
+        other.login(username='new user', password='test123')
+        response = other.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class ReplicaTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.router = PrimaryReplicaRouter()
+        self.directory = tempfile.TemporaryDirectory()
+        replica = os.path.join(self.directory.name, 'replica.sqlite3')
+        open(replica, 'w').close()
+        self.replica = mock.patch.dict(connections['replica'].settings_dict, NAME=replica)
+        self.replica.start()
+
+    def tearDown(self):
+        self.replica.stop()
+        self.directory.cleanup()
+        state.replica = state.wrote = state.pinned = False
+        del self.client
+        del self.user
+
+    def route(self, request):
+        @reads_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Post))
+        return ReplicaMiddleware(view)(request)
+
+    def test_safe_request_reads_replica_until_it_writes(self):
+        request = RequestFactory().get('/posts/')
+        response = self.route(request)
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        state.replica = True
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_unsafe_and_pinned_requests_read_primary(self):
+        self.assertEqual(self.route(RequestFactory().post('/posts/')).content, b'default')
+        request = RequestFactory().get('/posts/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request).content, b'default')
+
+    def test_missing_replica_is_not_used(self):
+        os.remove(connections['replica'].settings_dict['NAME'])
+        self.assertEqual(self.route(RequestFactory().get('/posts/')).content, b'default')
+
+    def test_writing_request_pins_client_to_primary(self):
+        response = self.client.post('/groups/new/', {'name': 'pinned', 'theme': 'GE'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        response = self.client.get('/groups/')
+        self.assertContains(response, 'pinned')
+
+    def test_copy_database(self):
+        primary = os.path.join(self.directory.name, 'primary.sqlite3')
+        with sqlite3.connect(primary) as db:
+            db.execute('CREATE TABLE t (x)')
+            db.execute('INSERT INTO t VALUES (1)')
+        copy_database(primary, connections['replica'].settings_dict['NAME'])
+        with sqlite3.connect(connections['replica'].settings_dict['NAME']) as db:
+            self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+
+    def test_sqlite_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(METRICS_DIR=self.directory.name,
+                                          METRICS_SERVER_TIMING=True)
+        self.settings.enable()
+        self.histograms = mock.patch.object(metrics, 'histograms', metrics.Histograms())
+        self.histograms.start()
+
+    def tearDown(self):
+        self.histograms.stop()
+        self.settings.disable()
+        self.directory.cleanup()
+        del self.client
+        del self.user
+
+    def test_response_has_server_timing(self):
+        response = self.client.get('/posts/')
+        self.assertRegex(response['Server-Timing'],
+                         r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+$')
+
+    def test_metrics_are_recorded_per_route(self):
+        self.client.get('/posts/')
+        self.client.get('/posts/')
+        self.client.get('/no-such-page/')
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('blog_request_duration_seconds_count{route="post_list"} 2', body)
+        self.assertIn('blog_db_queries_count{route="post_list"} 2', body)
+        self.assertIn('blog_template_duration_seconds_bucket{route="post_list",le="+Inf"} 2',
+                      body)
+        self.assertIn('blog_request_duration_seconds_count{route="other"} 1', body)
+        self.assertNotIn('blog_template_duration_seconds_sum{route="post_list"} 0.0\n', body)
+
+    def test_metrics_add_up_all_processes(self):
+        self.client.get('/posts/')
+        other = metrics.Histograms()
+        other.observe('blog_request_duration_seconds', 'post_list', 0.5)
+        with open(os.path.join(self.directory.name, '1.json'), 'w') as output:
+            json.dump(other.series, output)
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('blog_request_duration_seconds_count{route="post_list"} 2', body)
+
+    def test_metrics_are_only_served_to_allowed_addresses(self):
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+
+class GroupDirectoryTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        now = timezone.now()
+        for i, (name, theme) in enumerate([('Astronomy', 'SC'), ('astro club', 'SC'),
+                                           ('Football', 'SP'), ('Jazz', 'MU')]):
+            Group.objects.create(name=name, theme=theme, creator=self.user,
+                                 date_created=now - timezone.timedelta(minutes=i))
+        Group.objects.create(name='Apollo', theme='SC', creator=self.user,
+                             pending_delete=True)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+
+    def names(self, response):
+        return [group.name for group in response.context['group_list']]
+
+    def test_space_and_sport_have_distinct_codes(self):
+        codes = [code for code, _ in Group.THEME_CHOICES]
+        self.assertEqual(len(codes), len(set(codes)))
+        self.assertEqual(dict(Group.THEME_CHOICES)['SC'], 'Space')
+
+    def test_filter_by_theme(self):
+        response = self.client.get('/groups/', {'theme': 'SC'})
+        self.assertEqual(self.names(response), ['Astronomy', 'astro club'])
+
+    def test_unknown_theme_shows_all_groups(self):
+        response = self.client.get('/groups/', {'theme': 'XX'})
+        self.assertEqual(len(self.names(response)), 4)
+
+    def test_name_prefix_is_case_insensitive(self):
+        response = self.client.get('/groups/', {'q': 'ASTRO'})
+        self.assertEqual(self.names(response), ['Astronomy', 'astro club'])
+
+    def test_theme_counts_follow_search_but_not_theme(self):
+        response = self.client.get('/groups/', {'theme': 'SC', 'q': 'astro'})
+        counts = {item['code']: item['count'] for item in response.context['themes']}
+        self.assertEqual(counts['SC'], 2)
+        self.assertEqual(counts['SP'], 0)
+        response = self.client.get('/groups/', {'theme': 'SC'})
+        counts = {item['code']: item['count'] for item in response.context['themes']}
+        self.assertEqual((counts['SC'], counts['SP'], counts['MU']), (2, 1, 1))
+        self.assertEqual(response.context['total'], 4)
+
+    @override_settings(GROUPS_PAGE_SIZE=2)
+    def test_keyset_pagination_keeps_filters(self):
+        response = self.client.get('/groups/', {'q': 'a'})
+        self.assertEqual(self.names(response), ['Astronomy', 'astro club'])
+        self.assertIsNone(response.context['next_query'])
+        response = self.client.get('/groups/')
+        self.assertEqual(self.names(response), ['Astronomy', 'astro club'])
+        response = self.client.get('/groups/?' + response.context['next_query'])
+        self.assertEqual(self.names(response), ['Football', 'Jazz'])
+        self.assertIsNone(response.context['next_query'])
+
+    def test_indexes_serve_directory_queries(self):
+        cursor = encode_cursor(timezone.now(), 1)
+        for groups, index in ((Group.objects.directory(), 'group_feed_idx'),
+                              (Group.objects.directory(theme='SC'), 'group_theme_idx')):
+            plan = query_plan(after_cursor(groups, cursor)[:settings.GROUPS_PAGE_SIZE + 1])
+            self.assertIn(f'SEARCH blog_group USING INDEX {index}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        plan = query_plan(Group.objects.directory(prefix='astro').order_by('-date_created'))
+        self.assertIn('group_name_nocase_idx', plan)
+        plan = query_plan(Group.objects.directory(prefix='astro').order_by().values('theme')
+                          .annotate(n=Count('id')))
+        self.assertIn('group_name_nocase_idx', plan)
+
+    def test_theme_counts_are_cached_until_groups_change(self):
+        self.client.get('/groups/')
+        with self.assertNumQueries(3):  # session, user and the page of groups
+            response = self.client.get('/groups/')
+        self.assertEqual(response.context['total'], 4)
+        Group.objects.get(name='Jazz').mark_deleted()
+        self.assertEqual(self.client.get('/groups/').context['total'], 3)
+        Group.create(name='Chess', theme='GE', creator=self.user)
+        self.assertEqual(self.client.get('/groups/').context['total'], 4)
+
+
+class VisibilityTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.public_group = Group.create(name='public', theme='GE', creator=self.other)
+        self.private_group = Group.objects.create(name='private', theme='GE',
+                                                  creator=self.other, is_private=True)
+        self.public = self.create_post('public', self.public_group)
+        self.hidden = self.create_post('hidden', self.private_group)
+        self.others_draft = self.create_post('draft', self.public_group, published=False)
+        self.own_draft = self.create_post('mine', self.public_group, self.user, published=False)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.other
+
+    def create_post(self, title, group, creator=None, published=True):
+        return Post.objects.create(title=title, text=title, creator=creator or self.other,
+                                   group=group, is_private=group.is_private,
+                                   date_created=timezone.now() if published else None)
+
+    def visible(self, user):
+        return set(Post.objects.visible_to(user))
+
+    def test_visible_to_non_member(self):
+        self.assertEqual(self.visible(self.user), {self.public, self.own_draft})
+
+    def test_visible_to_member_of_private_group(self):
+        Membership.create(self.user, self.private_group)
+        self.assertEqual(self.visible(self.user), {self.public, self.hidden, self.own_draft})
+
+    def test_visible_to_anonymous_user(self):
+        self.assertEqual(self.visible(AnonymousUser()), {self.public})
+
+    def test_posts_of_deleted_groups_are_hidden(self):
+        self.public_group.mark_deleted()
+        self.assertEqual(self.visible(self.user), set())
+
+    def test_visible_to_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.visible(self.user)
+
+    def test_post_info_hides_private_posts_and_drafts_of_others(self):
+        for post in (self.hidden, self.others_draft):
+            response = self.client.get(f'/posts/{post.pk}')
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(f'/posts/{self.own_draft.pk}').status_code, 200)
+
+    def test_group_page_lists_published_posts_only(self):
+        response = self.client.get(f'/groups/{self.public_group.pk}/')
+        self.assertEqual([post['id'] for post in response.context['posts']], [self.public.pk])
+        response = self.client.get(f'/groups/{self.private_group.pk}/')
+        self.assertEqual(response.context['posts'], [])
+
+    def test_posts_list_includes_private_posts_of_members(self):
+        Membership.create(self.user, self.private_group)
+        response = self.client.get('/posts/')
+        self.assertEqual(list(response.context['post_list']), [self.hidden, self.public])
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        caches['template_fragments'].clear()
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(name='cards', theme='GE', creator=self.user)
+        self.post = Post.objects.create(title='first title', text='text', creator=self.user,
+                                        group=self.group, date_created=timezone.now())
+
+    def tearDown(self):
+        del self.client
+        del self.user
+
+    def test_post_card_is_cached_until_the_post_changes(self):
+        self.assertContains(self.client.get('/posts/'), 'first title')
+        self.assertContains(self.client.get(f'/groups/{self.group.pk}/'), 'first title')
+        # A write that doesn't bump date_updated leaves the cached card.
+        Post.objects.filter(pk=self.post.pk).update(title='second title')
+        self.assertContains(self.client.get('/posts/'), 'first title')
+        self.assertContains(self.client.get(f'/groups/{self.group.pk}/'), 'first title')
+        self.post.refresh_from_db()
+        self.post.save()
+        self.group.touch()
+        self.assertContains(self.client.get('/posts/'), 'second title')
+        self.assertContains(self.client.get(f'/groups/{self.group.pk}/'), 'second title')
+
+    def test_group_card_is_refreshed_by_membership_changes(self):
+        self.assertContains(self.client.get('/groups/'), 'Members:  0')
+        Membership.create(self.user, self.group)
+        self.assertContains(self.client.get('/groups/'), 'Members:  1')
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cache(self, **options):
+        return SQLiteCache(os.path.join(self.directory.name, 'cache.sqlite3'),
+                           {'OPTIONS': {'CULL_FREQUENCY': 100, **options}})
+
+    def test_get_set_add_delete(self):
+        cache = self.cache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'value': 1})
+        self.assertEqual(cache.get('a'), {'value': 1})
+        self.assertFalse(cache.add('a', 2))
+        self.assertTrue(cache.add('b', 2))
+        cache.delete('a')
+        self.assertFalse(cache.has_key('a'))
+        self.assertTrue(cache.has_key('b'))
+
+    def test_expired_entries_are_misses(self):
+        cache = self.cache()
+        cache.set('a', 1, timeout=-1)
+        self.assertIsNone(cache.get('a'))
+        self.assertTrue(cache.add('a', 2))
+        self.assertEqual(cache.get('a'), 2)
+
+    def test_evicts_least_recently_read_entries(self):
+        cache = self.cache(MAX_ENTRIES=3)
+        for key in 'abc':
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(key) for key in 'acd'], ['a', 'c', 'd'])
+
+    def test_evicts_down_to_max_size(self):
+        cache = self.cache(MAX_SIZE=3000)
+        for key in 'abc':
+            cache.set(key, 'x' * 900)
+        cache.get('a')
+        cache.set('d', 'x' * 900)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len([key for key in 'acd' if cache.has_key(key)]), 3)
+
+    def test_is_shared_between_instances(self):
+        self.cache().set('a', 1)
+        self.assertEqual(self.cache().get('a'), 1)
+
+    def test_hits_write_access_times_in_batches(self):
+        cache = self.cache(ACCESS_FLUSH_INTERVAL=60)
+        cache.set('a', 1)
+
+        def accessed():
+            with sqlite3.connect(cache.path) as db:
+                return db.execute("SELECT accessed FROM cache WHERE key = ':1:a'").fetchone()[0]
+        stored = accessed()
+        with mock.patch('blog.sqlite_cache.time.time', return_value=stored + 1):
+            self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(accessed(), stored)
+        cache.flush_access_times()
+        self.assertEqual(accessed(), stored + 1)
+
+    def test_database_errors_are_misses(self):
+        # A directory can't be opened as a database.
+        cache = SQLiteCache(self.directory.name, {})
+        with self.assertLogs('blog.sqlite_cache', 'WARNING'):
+            self.assertEqual(cache.get('a', 'default'), 'default')
+            cache.set('a', 1)
+            self.assertFalse(cache.add('a', 1))
+            self.assertFalse(cache.has_key('a'))
+
+
+@with_auth_cache
+class PageCacheTest(TestCase):
+    def setUp(self):
+        page_cache().clear()
+        self.client = Client(enforce_csrf_checks=True)
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.group = Group.create(name='open', theme='GE', creator=self.other)
+        Post.objects.create(title='cached post', text='text', creator=self.other,
+                            group=self.group, date_created=timezone.now())
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.other
+
+    def csrf_token(self, response):
+        return re.search(r'name="csrfmiddlewaretoken" value="(\w+)"',
+                         response.content.decode()).group(1)
+
+    def test_anonymous_pages_are_served_without_rendering(self):
+        first = self.client.get('/login/')
+        self.assertTemplateUsed(first, 'login.html')
+        second = Client().get('/login/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.templates, [])
+        self.assertNotIn(CSRF_PLACEHOLDER.decode(), second.content.decode())
+        self.assertIn('Cookie', second['Vary'])
+
+    def test_cached_page_carries_a_token_of_its_visitor(self):
+        self.client.get('/login/')
+        client = Client(enforce_csrf_checks=True)
+        response = client.get('/login/')
+        self.assertEqual(response.templates, [])
+        response = client.post('/login/', {'username': 'test', 'password': 'test123',
+                                           'csrfmiddlewaretoken': self.csrf_token(response)})
+        self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+    def test_signed_in_users_are_not_served_anonymous_pages(self):
+        self.client.get('/')
+        self.client.login(username='test', password='test123')
+        response = self.client.get('/')
+        self.assertTemplateUsed(response, 'homepage.html')
+        self.assertContains(response, 'Logout')
+
+    def test_public_group_page_is_shared_by_non_members(self):
+        self.client.login(username='test', password='test123')
+        self.assertTemplateUsed(self.client.get(f'/groups/{self.group.pk}/'),
+                                'groups/group_info.html')
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/groups/{self.group.pk}/')
+        self.assertEqual(response.templates, [])
+        self.assertContains(response, 'cached post')
+
+    def test_group_changes_purge_the_shared_page(self):
+        self.client.login(username='test', password='test123')
+        self.client.get(f'/groups/{self.group.pk}/')
+        Post.objects.create(title='new post', text='text', creator=self.other,
+                            group=self.group, date_created=timezone.now()).on_publish()
+        self.assertContains(self.client.get(f'/groups/{self.group.pk}/'), 'new post')
+
+    def test_members_get_their_own_page(self):
+        self.client.login(username='test', password='test123')
+        self.client.get(f'/groups/{self.group.pk}/')
+        Membership.objects.create(user=self.user, group=self.group, date_joined=timezone.now())
+        response = self.client.get(f'/groups/{self.group.pk}/')
+        self.assertTemplateUsed(response, 'groups/group_info.html')
+        self.assertContains(response, 'Leave')
+
+
+class ViewCounterTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.group = Group.create(name='read', theme='GE', creator=self.user)
+        self.posts = [Post.objects.create(title=f'post {i}', text='text', creator=self.user,
+                                          group=self.group, date_created=timezone.now())
+                      for i in range(3)]
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(VIEW_COUNT_SPOOL_DIR=self.directory.name)
+        self.settings.enable()
+        self.counter = counters.ViewCounter()
+        self.patch = mock.patch.object(counters, 'view_counter', self.counter)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.settings.disable()
+        self.directory.cleanup()
+        del self.client
+        del self.user
+
+    def view_counts(self):
+        return list(Post.objects.filter(pk__in=[post.pk for post in self.posts])
+                    .order_by('pk').values_list('view_count', flat=True))
+
+    def test_views_are_counted_without_writing(self):
+        post = self.posts[0]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(f'/posts/{post.pk}')
+            self.client.get(f'/posts/{post.pk}')
+        self.assertFalse([query for query in captured.captured_queries
+                          if not query['sql'].startswith('SELECT')])
+        self.assertEqual(self.counter.pending, {post.pk: 2})
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.view_counts(), [2, 0, 0])
+        self.assertEqual(self.counter.pending, {})
+
+    def test_drafts_are_not_counted(self):
+        draft = Post.objects.create(title='draft', text='text', creator=self.user,
+                                    group=self.group)
+        self.client.get(f'/posts/{draft.pk}')
+        self.assertEqual(self.counter.pending, {})
+
+    @override_settings(VIEW_COUNT_BATCH_SIZE=2)
+    def test_flush_writes_one_update_per_batch(self):
+        for post, views in zip(self.posts, (3, 1, 2)):
+            self.counter.add(post.pk, views)
+        with CaptureQueriesContext(connection) as captured:
+            self.counter.flush()
+        updates = [query['sql'] for query in captured.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('CASE id WHEN', updates[0])
+        self.assertEqual(self.view_counts(), [3, 1, 2])
+
+    def test_failed_flush_keeps_the_counts(self):
+        self.counter.add(self.posts[0].pk)
+        with mock.patch.object(counters, 'write_counts', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.counter.flush()
+        self.assertEqual(self.counter.pending, {self.posts[0].pk: 1})
+
+    def test_counts_spooled_at_exit_are_loaded_by_the_next_flush(self):
+        self.counter.add(self.posts[1].pk, 4)
+        with mock.patch.object(counters, 'write_counts', side_effect=RuntimeError), \
+                self.assertLogs('blog.counters', 'ERROR'):
+            self.counter.stop()
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+        counters.ViewCounter().flush()
+        self.assertEqual(self.view_counts(), [0, 4, 0])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_post_page_shows_view_count(self):
+        Post.objects.filter(pk=self.posts[0].pk).update(view_count=7)
+        self.assertContains(self.client.get(f'/posts/{self.posts[0].pk}'), 'Views: 7')
+
+    def test_popular_posts_are_ordered_by_views(self):
+        for post, views in zip(self.posts, (3, 5, 1)):
+            self.counter.add(post.pk, views)
+        self.counter.flush()
+        response = self.client.get('/posts/popular/')
+        self.assertEqual(list(response.context['post_list']),
+                         [self.posts[1], self.posts[0], self.posts[2]])
+
+
+@with_auth_cache
+class TrendingTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.quiet = Group.create(name='quiet', theme='GE', creator=self.other)
+        self.busy = Group.create(name='busy', theme='GE', creator=self.other)
+
+    def tearDown(self):
+        del self.client
+        del self.user
+        del self.other
+
+    def trending(self):
+        return [trend.group for trend in self.client.get('/groups/trending/').context['trends']]
+
+    def test_logaddexp(self):
+        self.assertAlmostEqual(trending.logaddexp(math.log(2), math.log(3)), math.log(5))
+        self.assertEqual(trending.logaddexp(None, 1.5), 1.5)
+        self.assertAlmostEqual(trending.logaddexp(20000.0, 20000.0), 20000 + math.log(2))
+
+    def test_score_halves_every_half_life(self):
+        now = timezone.now()
+        GroupTrend.record(self.busy.pk, 8, now)
+        trend = GroupTrend.objects.get(group=self.busy)
+        self.assertAlmostEqual(trend.score(now), 8)
+        later = now + timezone.timedelta(seconds=2 * settings.TRENDING_HALF_LIFE)
+        self.assertAlmostEqual(trend.score(later), 2)
+
+    def test_events_add_up(self):
+        now = timezone.now()
+        GroupTrend.record(self.busy.pk, 1, now)
+        GroupTrend.record(self.busy.pk, 2, now)
+        self.assertAlmostEqual(GroupTrend.objects.get(group=self.busy).score(now), 3)
+
+    def test_joins_invites_and_posts_are_scored(self):
+        self.client.post(f'/groups/{self.busy.pk}/')
+        self.assertEqual(self.trending(), [self.busy])
+        Membership.invite(self.quiet, ['test'])
+        Post.objects.create(title='news', text='text', creator=self.user, group=self.quiet,
+                            date_created=timezone.now()).on_publish()
+        self.assertEqual(self.trending(), [self.quiet, self.busy])
+
+    def test_creators_joining_their_groups_are_not_scored(self):
+        self.client.post('/groups/new/', {'name': 'mine', 'theme': 'GE', 'private': 'on'})
+        mine = Group.objects.get(name='mine')
+        self.assertTrue(Membership.objects.filter(user=self.user, group=mine).exists())
+        Membership.invite(self.busy, ['new user'])
+        self.assertEqual(self.trending(), [])
+
+    def test_recent_activity_outranks_older_activity(self):
+        old = timezone.now() - timezone.timedelta(seconds=3 * settings.TRENDING_HALF_LIFE)
+        GroupTrend.record(self.quiet.pk, 5, old)
+        GroupTrend.record(self.busy.pk, 1)
+        self.assertEqual(self.trending(), [self.busy, self.quiet])
+
+    def test_deleted_groups_leave_the_ranking(self):
+        GroupTrend.record(self.busy.pk, 1)
+        self.busy.mark_deleted()
+        self.assertEqual(self.trending(), [])
+
+    def test_trending_is_one_query(self):
+        for group in (self.quiet, self.busy):
+            GroupTrend.record(group.pk, 1)
+        self.client.get('/groups/trending/')
+        with self.assertNumQueries(1):
+            self.client.get('/groups/trending/')
+
+
+class ArchiveTest(TransactionTestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(**LOGIN_USER_DATA)
+        self.other = User.objects.create_user(**NEW_USER_DATA)
+        self.client.login(username='test', password='test123')
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = mock.patch.dict(
+            connections['archive'].settings_dict,
+            NAME=os.path.join(self.directory.name, 'archive.sqlite3'))
+        self.archive.start()
+        connections['archive'].close()
+        self.group = Group.create(name='old news', theme='GE', creator=self.other)
+        old = timezone.now() - timezone.timedelta(days=settings.ARCHIVE_AFTER_DAYS + 1)
+        self.old = Post.objects.create(title='old', text='old text', creator=self.other,
+                                       group=self.group, date_created=old)
+        self.new = Post.objects.create(title='new', text='new text', creator=self.other,
+                                       group=self.group, date_created=timezone.now())
+        Group.objects.rebuild_counters()
+        page_cache().clear()
+
+    def tearDown(self):
+        connections['archive'].close()
+        self.archive.stop()
+        self.directory.cleanup()
+        del self.client
+        del self.user
+        del self.other
+
+    def archive_posts(self, *args):
+        call_command('archive_posts', *args, stdout=StringIO())
+
+    def test_old_posts_move_to_the_archive(self):
+        self.archive_posts('--batch-size', '1')
+        self.assertEqual(list(Post.objects.all()), [self.new])
+        archived = ArchivedPost.objects.get()
+        self.assertEqual((archived.pk, archived.text, archived.group_id),
+                         (self.old.pk, 'old text', self.group.pk))
+
+    def test_counters_include_archived_posts(self):
+        last_post_at = Group.objects.get(pk=self.group.pk).last_post_at
+        self.archive_posts()
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual((group.post_count, group.archived_post_count), (2, 1))
+        call_command('rebuild_group_counters', stdout=StringIO())
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual((group.post_count, group.archived_post_count), (2, 1))
+        self.assertEqual(group.last_post_at, last_post_at)
+
+    def test_archiving_again_overwrites_a_leftover_copy(self):
+        self.archive_posts()
+        Post.objects.bulk_create([ArchivedPost.objects.get().as_post()])
+        self.archive_posts()
+        self.assertEqual(ArchivedPost.objects.count(), 1)
+        self.assertFalse(Post.objects.filter(pk=self.old.pk).exists())
+
+    def test_post_info_falls_back_to_the_archive(self):
+        self.archive_posts()
+        response = self.client.get(f'/posts/{self.old.pk}')
+        self.assertContains(response, 'old text')
+        self.assertContains(response, 'Archived')
+        self.assertTrue(response.context['archived'])
+        self.assertEqual(self.client.get('/posts/0').status_code, 404)
+
+    def test_private_archived_posts_need_membership(self):
+        Post.objects.filter(pk=self.old.pk).update(is_private=True)
+        self.archive_posts()
+        self.assertEqual(self.client.get(f'/posts/{self.old.pk}').status_code, 404)
+        Membership.create(self.user, self.group)
+        self.assertEqual(self.client.get(f'/posts/{self.old.pk}').status_code, 200)
+
+    def test_group_page_lists_archived_posts_after_hot_ones(self):
+        self.archive_posts()
+        response = self.client.get(f'/groups/{self.group.pk}/')
+        self.assertEqual([post['id'] for post in response.context['posts']],
+                         [self.new.pk, self.old.pk])
+
+    @override_settings(POSTS_PAGE_SIZE=2)
+    def test_group_page_pages_through_hot_then_archived_posts(self):
+        now = timezone.now()
+        hot = [self.new] + [
+            Post.objects.create(title=f'hot {n}', text='text', creator=self.other,
+                                group=self.group, date_created=now - timezone.timedelta(hours=n))
+            for n in (1, 2)]
+        older = Post.objects.create(title='older', text='text', creator=self.other,
+                                    group=self.group, date_created=self.old.date_created
+                                    - timezone.timedelta(days=1))
+        self.archive_posts()
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(f'/groups/{self.group.pk}/',
+                                       {'after': cursor} if cursor else {})
+            pages.append([post['id'] for post in response.context['posts']])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[hot[0].pk, hot[1].pk], [hot[2].pk, self.old.pk], [older.pk]])
+        plan = query_plan(after_cursor(Post.objects.published().filter(group=self.group),
+                                       encode_cursor(now, self.new.pk))[:3])
+        self.assertIn('post_group_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_restore_moves_posts_back(self):
+        self.archive_posts()
+        call_command('restore_posts', '--group', str(self.group.pk), stdout=StringIO())
+        self.assertFalse(ArchivedPost.objects.exists())
+        restored = Post.objects.get(pk=self.old.pk)
+        self.assertEqual((restored.text, restored.date_created),
+                         ('old text', self.old.date_created))
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual((group.post_count, group.archived_post_count), (2, 0))
+
+    def test_restore_after_a_crash_counts_each_post_once(self):
+        self.archive_posts()
+        # A run died after restoring the post, before clearing the archive.
+        Post.objects.bulk_create([ArchivedPost.objects.get().as_post()])
+        Group.archived_posts_moved({self.group.pk: 1}, -1)
+        call_command('restore_posts', str(self.old.pk), stdout=StringIO())
+        self.assertFalse(ArchivedPost.objects.exists())
+        group = Group.objects.get(pk=self.group.pk)
+        self.assertEqual((group.post_count, group.archived_post_count), (2, 0))
+
+    def test_restore_needs_posts_to_restore(self):
+        with self.assertRaises(CommandError):
+            call_command('restore_posts', stdout=StringIO())
@@ -0,0 +1,45 @@
+import heapq
+
+from django.conf import settings
+
+from .models import Membership, Post, TimelineEntry
+from .pagination import after_cursor, split_page
+
+
+def sort_key(post):
+    return post.date_created, post.pk
+
+
+def read_timeline(user, cursor, page_size):
+    """
+    Return one page of the published posts from the user's groups, newest
+    first, and the cursor of the next page.
+
+    Fanned-out posts come from one range scan of the user's timeline; posts
+    of groups too large to fan out are read per group from their
+    ``(group, date_created, id)`` index and merged in.
+    """
+    entries = after_cursor(TimelineEntry.objects.filter(user=user, group__pending_delete=False),
+                           cursor, tiebreak='post_id')
+    entries = (entries.select_related('post__creator', 'post__group')
+               .defer('post__text')[:page_size + 1])
+    streams = [(entry.post for entry in entries)]
+
+    large_groups = (Membership.objects
+                    .filter(user=user, group__member_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+                            group__pending_delete=False)
+                    .values_list('group_id', flat=True))
+    for group_id in large_groups:
+        posts = after_cursor(Post.objects.published().filter(group_id=group_id), cursor)
+        streams.append(posts.select_related('creator', 'group').defer('text')[:page_size + 1])
+
+    page, seen = [], set()
+    for post in heapq.merge(*streams, key=sort_key, reverse=True):
+        # A group that grew past the limit has both copied and merged posts.
+        if post.pk in seen:
+            continue
+        seen.add(post.pk)
+        page.append(post)
+        if len(page) > page_size:
+            break
+    return split_page(page, page_size, sort_key)
@@ -0,0 +1,51 @@
+"""
+Decaying activity scores for the trending groups.
+
+Every post, join and invite adds its weight to the score of its group, and
+the score halves every ``TRENDING_HALF_LIFE`` seconds. Decaying every row
+over time would mean rewriting the whole table, so ``GroupTrend`` stores
+
+    log_score = log(sum(weight * exp(rate * (event_time - EPOCH))))
+
+instead. Events only add to it, and the order of groups by ``log_score`` is
+the same as by their decayed score at any moment, so the ranking is an
+index scan. The score itself is worked out when read, see
+:func:`current_score`.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+from .pagination import EPOCH
+
+# Name of the SQL function registered on SQLite connections.
+LOGADDEXP = 'trend_logaddexp'
+
+
+def decay_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def log_weight(weight, when):
+    """The ``log_score`` of a single event."""
+    return math.log(weight) + decay_rate() * (when - EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    """``log(exp(a) + exp(b))`` without overflowing; None stands for a zero score."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def current_score(log_score, now=None):
+    now = now or timezone.now()
+    return math.exp(log_score - decay_rate() * (now - EPOCH).total_seconds())
+
+
+def register_functions(sqlite_connection):
+    sqlite_connection.create_function(LOGADDEXP, 2, logaddexp, deterministic=True)
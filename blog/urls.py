@@ -1,7 +1,7 @@
 from django.urls import path
 from django.conf.urls import url
 from django.contrib.auth import views as v
-from . import views
+from . import metrics, views
 
 urlpatterns = [
     # url(r'^$', views.home_page, name='home'),
@@ -11,6 +11,7 @@ urlpatterns = [
     path('register/', views.user_registration, name='registration'),
     path('groups/', views.GroupsList.as_view(), name='group_list'),
     path('groups/new/', views.GroupCreate.as_view(), name='group_create'),
+    path('groups/trending/', views.TrendingGroups.as_view(), name='group_trending'),
     path('groups/<int:group_id>/', views.GroupPage.as_view(), name='group_info'),
     path('groups/<int:group_id>/update/', views.GroupUpdate.as_view(),
          name='group_update'),
@@ -20,14 +21,18 @@ urlpatterns = [
          name='post_create'),
     path('posts/', views.PostsList.as_view(), name='post_list'),
     path('posts/<int:pk>', views.PostInfo.as_view(), name='post_info'),
+    path('posts/search/', views.PostSearch.as_view(), name='post_search'),
+    path('posts/popular/', views.PopularPosts.as_view(), name='post_popular'),
     # path('posts/create/', views.PostCreate.as_view(), name='post_create'),
     path('posts/<int:post_id>/update/', views.PostUpdate.as_view(),
          name='post_update'),
     path('posts/<int:post_id>/delete/', views.PostDelete.as_view(),
          name='post_delete'),
     path('drafts/', views.DraftsList.as_view(), name='drafts_list'),
+    path('feed/', views.Feed.as_view(), name='my_feed'),
     path('posts/<int:draft_id>/publish/', views.publish, name='draft_publish'),
-    path('groups/<int:group_id>/invite/', views.invite, name='invite')
+    path('groups/<int:group_id>/invite/', views.invite, name='invite'),
+    path('metrics/', metrics.metrics, name='metrics'),
 
 
 ]
\ No newline at end of file
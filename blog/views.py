@@ -1,3 +1,8 @@
+import heapq
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import (ListView, DetailView, View, TemplateView)
 from django.contrib.auth.models import User
@@ -5,11 +10,21 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.http import HttpResponseRedirect, HttpResponse, JsonResponse
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse, Http404
 from django.conf import settings
-from .models import Group, Membership, Post
-from .forms import GroupForm, PostForm
+from django.db import transaction
+from .models import ArchivedPost, Group, GroupTrend, Membership, Post, cached_theme_counts
+from .forms import GroupForm, PostForm, split_usernames
+from .conditional import conditional_response, page_etag
+from .counters import record_view
+from .page_cache import shared_page
+from .pagination import after_cursor, keyset_page, split_page
+from .routers import archive_available, reads_from_replica
+from .search import search_posts
+from .tasks import purge_group
+from .timeline import read_timeline
 from django.utils import timezone
+from django.utils.http import urlencode
 from django.template.response import TemplateResponse
 
 
@@ -66,59 +81,103 @@ def user_registration(request):
                                     status=400)
 
 
+@method_decorator(reads_from_replica, name='get')
 class GroupsList(LoginRequiredMixin, ListView):
 
     model = Group
     template_name = 'groups/groups_list.html'
-
-
+    context_object_name = 'group_list'
+
+    def get_queryset(self):
+        theme = self.request.GET.get('theme')
+        self.theme = theme if theme in dict(Group.THEME_CHOICES) else None
+        self.prefix = self.request.GET.get('q', '').strip()
+        groups = Group.objects.directory(prefix=self.prefix)
+        # Counts under a prefix read just its range of group_name_nocase_idx.
+        self.theme_counts = groups.theme_counts() if self.prefix else cached_theme_counts()
+        page, self.next_cursor = keyset_page(
+            groups.directory(theme=self.theme).select_related('creator'),
+            self.request.GET.get('after'), settings.GROUPS_PAGE_SIZE)
+        return page
+
+    def get_context_data(self, **kwargs):
+        def query(**params):
+            params = {'q': self.prefix, **params}
+            return urlencode({key: value for key, value in params.items() if value})
+
+        themes = [{'code': code, 'name': name, 'count': self.theme_counts.get(code, 0),
+                   'query': query(theme=code)}
+                  for code, name in Group.THEME_CHOICES]
+        return super().get_context_data(
+            themes=themes, theme=self.theme, q=self.prefix,
+            total=sum(self.theme_counts.values()), all_query=query(),
+            next_query=self.next_cursor and query(theme=self.theme, after=self.next_cursor),
+            **kwargs)
+
+
+@method_decorator(reads_from_replica, name='get')
+class TrendingGroups(LoginRequiredMixin, ListView):
+
+    template_name = 'groups/trending_groups.html'
+    context_object_name = 'trends'
+
+    def get_queryset(self):
+        # mark_deleted() drops the scores of deleted groups; filtering on
+        # the group here would make SQLite scan groups instead of the index.
+        trends = (GroupTrend.objects.select_related('group')
+                  .order_by('-log_score')[:settings.TRENDING_GROUPS])
+        return [trend for trend in trends if not trend.group.pending_delete]
+
+
+@method_decorator(reads_from_replica, name='get')
 class GroupPage(LoginRequiredMixin, TemplateView):
 
     def get(self, request, group_id):
         template_name = 'groups/group_info.html'
-        group = get_object_or_404(Group, pk=group_id)
-        post_list = Post.objects.filter(group=group_id).values()
-        posts = [elem for elem in post_list]
-        user = request.user
-        is_member = self.is_member(user, group)
-        is_creator = self.is_creator(user.pk, group_id)
-        return render(request, template_name, {'is_member': is_member,
-                                               'is_creator': is_creator,
-                                               'group': group,
-                                               'posts': posts})
+        group = get_object_or_404(Group.objects.select_related('creator'), pk=group_id)
+        is_member = request.access.is_member(group)
+        is_creator = request.access.is_creator(group)
+        cursor = request.GET.get('after')
+        etag = page_etag(request, 'group', group.pk, group.date_updated.timestamp(),
+                         is_member, is_creator, cursor)
+
+        def render_page():
+            page_size = settings.POSTS_PAGE_SIZE
+            fields = ('id', 'title', 'excerpt', 'date_created', 'date_updated')
+            posts = after_cursor(Post.objects.published().visible_to(request.user)
+                                 .filter(group=group_id), cursor)
+            streams = [posts.values(*fields)[:page_size + 1]]
+            if archive_available():
+                # Each page reads the archive from the same cursor, so
+                # restored posts older than archived ones stay in order.
+                archived = ArchivedPost.objects.filter(group_id=group.pk)
+                if not is_member:
+                    archived = archived.filter(is_private=False)
+                streams.append(after_cursor(archived, cursor).values(*fields)[:page_size + 1])
+            key = itemgetter('date_created', 'id')
+            posts = list(islice(heapq.merge(*streams, key=key, reverse=True), page_size + 1))
+            posts, next_cursor = split_page(posts, page_size, key)
+            return render(request, template_name, {'is_member': is_member,
+                                                   'is_creator': is_creator,
+                                                   'group': group,
+                                                   'posts': posts,
+                                                   'next_cursor': next_cursor})
+        if not (is_member or group.is_private or cursor):
+            # Every non-member sees the same first page.
+            render_page = partial(shared_page, request, f'page:group:{group.pk}',
+                                  group.date_updated.timestamp(), render_page)
+        return conditional_response(request, etag, group.date_updated, render_page)
 
     def post(self, request, group_id):
-        group = get_object_or_404(Group, pk=group_id)
+        group = get_object_or_404(Group.objects, pk=group_id)
         user = request.user
-        is_member = self.is_member(user, group)
-        if is_member:
-            membership = Membership.objects.get(group=group, user=user)
-            membership.delete()
+        if request.access.is_member(group):
+            Membership.remove(user, group)
         else:
-            Membership.objects.create(group=group, user=user,
-                                      date_joined=timezone.now())
+            Membership.create(user, group)
         return HttpResponseRedirect(f'/groups/{group_id}/')
 
 
-    @staticmethod
-    def is_member(user, group):
-        try:
-            Membership.objects.get(group=group, user=user)
-            is_member = True
-        except Membership.DoesNotExist:
-            is_member = False
-        return is_member
-
-    @staticmethod
-    def is_creator(user_id, group_id):
-        user = User.objects.get(pk=user_id)
-        group = Group.objects.get(pk=group_id)
-        creator = group.creator
-        if creator.pk == user.pk:
-            return True
-        return False
-
-
 class GroupCreate(LoginRequiredMixin, TemplateView):
 
     def get(self, request):
@@ -143,9 +202,9 @@ class GroupCreate(LoginRequiredMixin, TemplateView):
                 group.save()
             else:
                 group.is_private = True
-                group.save()
-                membership = Membership(user=creator, group=group, date_joined=timezone.now())
-                membership.save()
+                with transaction.atomic():
+                    group.save()
+                    Membership.create(creator, group)
             return HttpResponseRedirect('/groups/')
         return HttpResponse("Data is not valid", status=400)
 
@@ -153,22 +212,20 @@ class GroupCreate(LoginRequiredMixin, TemplateView):
 class GroupUpdate(LoginRequiredMixin, TemplateView):
 
     def get(self, request, group_id):
-        group = Group.objects.get(pk=group_id)
+        group = get_object_or_404(Group.objects, pk=group_id)
         form = GroupForm(instance=group)
-        user = request.user
         template_name = "groups/group_form.html"
-        if GroupPage.is_creator(user.pk, group_id):
+        if request.access.is_creator(group):
             return render(request, template_name, {'form': form})
         return render(request, template_name, {'form': form,
                                             'error': "Only creator is allowed to update the group"})
 
     def post(self, request, group_id):
-        user = request.user
-        group = get_object_or_404(Group, id=group_id)
-        if GroupPage.is_creator(user.pk, group_id):
+        group = get_object_or_404(Group.objects, id=group_id)
+        if request.access.is_creator(group):
             name = request.POST.get('name')
             theme = request.POST.get('theme')
-            data = {'name': name, 'theme': theme, 'creator': group.creator.pk}
+            data = {'name': name, 'theme': theme, 'creator': group.creator_id}
             form = GroupForm(data=data, instance=group)
             if form.is_valid():
                 form.save()
@@ -181,37 +238,32 @@ class GroupDelete(LoginRequiredMixin, TemplateView):
     template_name = 'groups/group_form.html'
 
     def post(self, request, group_id):
-        group = get_object_or_404(Group, pk=group_id)
-        try:
-            group.delete()
-            return HttpResponseRedirect('/groups/')
-        except:
-            return HttpResponse("Couldn't delete", status=400)
+        group = get_object_or_404(Group.objects, pk=group_id)
+        with transaction.atomic():
+            group.mark_deleted()
+            purge_group.delay(group.pk)
+        return HttpResponseRedirect('/groups/')
+
+
+def invite_message(report):
+    parts = [f"{label}: {', '.join(names)}" for label, names in (
+        ("Invited", report.invited),
+        ("Already members", report.already_members),
+        ("Unknown users", report.unknown)) if names]
+    return '. '.join(parts) or "No usernames given"
 
 
 @login_required
 def invite(request, group_id):
     if request.method == "POST":
-        user_current = request.user
-        username = request.POST.get('invited_user')
-        group = get_object_or_404(Group, pk=group_id)
-        is_creator = GroupPage.is_creator(user_current.pk, group.pk)
+        group = get_object_or_404(Group.objects.select_related('creator'), pk=group_id)
+        report = Membership.invite(group, split_usernames(request.POST.get('invited_user', '')))
+        group.refresh_from_db(fields=['member_count'])
         data = {'group': group,
                 'is_member': True,
-                'is_creator': is_creator}
-        try:
-            user = User.objects.get(username=username)
-            try:
-                member = Membership.objects.get(user=user, group=group)
-                return render(request, 'groups/group_info.html',
-                              {**data,'message': "User is a member already"})
-            except Membership.DoesNotExist:
-                membership = Membership(user=user, group=group, date_joined=timezone.now())
-                membership.save()
-            return render(request, 'groups/group_info.html', {**data,'message': "User was invited"} )
-
-        except User.DoesNotExist:
-            return render(request, 'groups/group_info.html', {**data, 'message': "User doesn't exist",})
+                'is_creator': request.access.is_creator(group)}
+        return render(request, 'groups/group_info.html',
+                      {**data, 'message': invite_message(report)})
 
 
 
@@ -222,14 +274,74 @@ def invite(request, group_id):
 #
 #
 
+@method_decorator(reads_from_replica, name='get')
 class PostsList(LoginRequiredMixin, ListView):
 
     model = Post
     template_name = 'posts/posts_list.html'
+    context_object_name = 'post_list'
 
+    def get_queryset(self):
+        posts = (Post.objects.published().visible_to(self.request.user)
+                 .select_related('creator')
+                 .only('title', 'excerpt', 'date_created', 'date_updated', 'creator__username'))
+        page, self.next_cursor = keyset_page(posts, self.request.GET.get('after'),
+                                             settings.POSTS_PAGE_SIZE)
+        return page
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(next_cursor=self.next_cursor, **kwargs)
+
+@method_decorator(reads_from_replica, name='get')
+class PopularPosts(LoginRequiredMixin, ListView):
+
+    template_name = 'posts/popular_posts.html'
+    context_object_name = 'post_list'
+
+    def get_queryset(self):
+        return (Post.objects.published().visible_to(self.request.user)
+                .select_related('creator')
+                .only('title', 'excerpt', 'date_created', 'date_updated', 'view_count',
+                      'creator__username')
+                .order_by('-view_count', '-id')[:settings.POSTS_PAGE_SIZE])
+
+
+@method_decorator(reads_from_replica, name='get')
 class PostInfo(LoginRequiredMixin, DetailView):
 
     model = Post
+
+    def get_queryset(self):
+        return Post.objects.visible_to(self.request.user).select_related('creator', 'group')
+
+    def get_archived_object(self):
+        """The post from the archive, if it was moved there and the viewer may see it."""
+        if not archive_available():
+            raise Http404("No post found matching the query")
+        archived = ArchivedPost.objects.filter(pk=self.kwargs['pk']).first()
+        group = archived and Group.objects.filter(pk=archived.group_id).first()
+        if group is None or archived.is_private and not self.request.access.is_member(group):
+            raise Http404("No post found matching the query")
+        post = archived.as_post()
+        post.group = group
+        return post
+
+    def get(self, request, *args, **kwargs):
+        try:
+            self.object = post = self.get_object()
+            archived = False
+        except Http404:
+            self.object = post = self.get_archived_object()
+            archived = True
+        if post.date_created and not archived:
+            record_view(post.pk)
+        last_modified = max(post.date_updated, post.group.date_updated)
+        etag = page_etag(request, 'post', post.pk, post.date_updated.timestamp(),
+                         post.group.date_updated.timestamp(), post.view_count)
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: self.render_to_response(self.get_context_data(object=post,
+                                                                  archived=archived)))
     template_name = 'posts/post_info.html'
 
 class PostCreate(LoginRequiredMixin, TemplateView):
@@ -237,9 +349,8 @@ class PostCreate(LoginRequiredMixin, TemplateView):
     def get(self, request, group_id):
         template_name = 'posts/post_create.html'
         form = PostForm()
-        creator = request.user
-        group = get_object_or_404(Group, pk=group_id)
-        if GroupPage.is_member(creator, group):
+        group = get_object_or_404(Group.objects, pk=group_id)
+        if request.access.can_post(group):
             return render(request, template_name, {'form': form})
         return render(request, 'posts/post_create.html',
                       {'error': "You must join group to create posts"})
@@ -249,76 +360,110 @@ class PostCreate(LoginRequiredMixin, TemplateView):
         text = request.POST.get('text')
         creator = request.user
         publish = request.POST.get('publish')
-        group = get_object_or_404(Group, pk=group_id)
-        if GroupPage.is_member(creator, group):
+        group = get_object_or_404(Group.objects, pk=group_id)
+        if request.access.can_post(group):
             data = {'title': title,
                     'text': text,
                     'creator': creator.pk,
-                    'group': group.pk}
+                    'group': group.pk,
+                    'publish_at': request.POST.get('publish_at')}
             form = PostForm(data)
+            if 'publish_at' in form.errors:
+                # Publishing at once would ignore a mistyped schedule.
+                return HttpResponse("Invalid publication time", status=400)
             if form.is_valid():
                 post = form.instance
-                if publish is None:
+                publish_at = form.cleaned_data['publish_at']
+                if publish_at is not None:
+                    post.publish_at = publish_at
+                elif publish is None:
                     post.date_created = timezone.now()
-                post.save()
-                if group.is_private == True:
-                    post.is_private = True
+                post.is_private = group.is_private
+                with transaction.atomic():
                     post.save()
+                    if post.date_created:
+                        post.on_publish()
+                    else:
+                        group.touch()
                 return HttpResponseRedirect('/posts/')
         return render(request, 'posts/post_create.html', {'error': "You must join group to create posts"})
 
 class PostUpdate(LoginRequiredMixin, TemplateView):
 
-    @staticmethod
-    def is_creator(user_id, post_id):
-        user = User.objects.get(pk=user_id)
-        post = Post.objects.get(pk=post_id)
-        creator = post.creator
-        if creator.pk == user.pk:
-            return True
-        return False
-
     def get(self, request, post_id):
-        user_id = request.user.pk
         template_name = 'posts/post_form.html'
-        post = get_object_or_404(Post, pk=post_id)
+        post = get_object_or_404(Post.objects.visible_to(request.user), pk=post_id)
         form = PostForm(instance=post)
-        if self.is_creator(user_id, post_id):
+        if request.access.is_creator(post):
             return render(request, template_name, {'form': form})
         else:
             return render(request, template_name, {'form': form, 'error':"Only creator is allowed to update the group" })
 
 
     def post(self, request, post_id):
-        user_id = request.user.pk
-        if self.is_creator(user_id, post_id):
+        post = get_object_or_404(Post.objects.select_related('group'), pk=post_id)
+        if request.access.is_creator(post):
             title = request.POST.get('title')
             text = request.POST.get('text')
-            post = get_object_or_404(Post, pk=post_id)
-            data = {'title': title, 'text': text, 'creator': post.creator.pk,
-                    'group': post.group.pk}
+            data = {'title': title, 'text': text, 'creator': post.creator_id,
+                    'group': post.group_id}
             form = PostForm(data=data, instance=post)
             if form.is_valid():
-                form.save()
+                with transaction.atomic():
+                    form.save()
+                    post.group.touch()
                 return HttpResponseRedirect(f'/posts/{post_id}')
         return render(request, 'posts/post_form.html', {'error': "Only creator is allowed to update the group"})
 
 class PostDelete(LoginRequiredMixin, TemplateView):
 
     def post(self, request, post_id):
-        post = get_object_or_404(Post, pk=post_id)
+        post = get_object_or_404(Post.objects.select_related('group'), pk=post_id)
         try:
-            post.delete()
+            with transaction.atomic():
+                post.delete()
+                if post.date_created:
+                    post.group.post_removed()
             return HttpResponseRedirect('/posts/')
         except:
             return HttpResponse("Couldn't delete", status=400)
 
 
+class PostSearch(LoginRequiredMixin, TemplateView):
+
+    def get(self, request):
+        template_name = 'posts/search_results.html'
+        query = request.GET.get('q', '')
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            raise Http404("Invalid page")
+        posts, has_next = search_posts(query, request.user, page,
+                                       settings.POSTS_PAGE_SIZE)
+        return render(request, template_name, {'query': query,
+                                               'posts': posts,
+                                               'page': page,
+                                               'has_next': has_next})
+
+
+@method_decorator(reads_from_replica, name='get')
+class Feed(LoginRequiredMixin, TemplateView):
+
+    def get(self, request):
+        template_name = 'posts/feed.html'
+        posts, next_cursor = read_timeline(request.user, request.GET.get('after'),
+                                           settings.POSTS_PAGE_SIZE)
+        return render(request, template_name, {'posts': posts,
+                                               'next_cursor': next_cursor})
+
+
+@method_decorator(reads_from_replica, name='get')
 class DraftsList(LoginRequiredMixin, ListView):
 
     def get(self, request):
         user = request.user
-        posts = Post.objects.filter(creator=user, date_created=None).values()
+        posts = Post.objects.visible_to(user).filter(creator=user, date_created=None).values(
+            'id', 'title', 'excerpt', 'date_created', 'publish_at')
         drafts = [elem for elem in posts]
         template_name = 'posts/drafts_list.html'
         return render(request, template_name, {'drafts': drafts})
@@ -327,9 +472,7 @@ class DraftsList(LoginRequiredMixin, ListView):
 @login_required
 def publish(request, draft_id):
     if request.method == "POST":
-        post = Post.objects.get(pk=draft_id)
-        post.date_created = timezone.now()
-        post.save()
+        Post.objects.filter(pk=draft_id).publish(defer_fan_out=True)
         return HttpResponseRedirect('/drafts/')
 
 
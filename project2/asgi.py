@@ -0,0 +1,128 @@
+"""
+ASGI config for project2 project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI handler, so each HTTP request is handed to the WSGI
+handler on a pool of ``ASGI_THREADS`` threads. The event loop keeps accepting
+connections while those threads wait on the database, and the whole
+middleware stack runs unchanged.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project2.settings')
+
+
+class WsgiToAsgi:
+    """ASGI 3 application running a WSGI application on a bounded thread pool."""
+
+    def __init__(self, wsgi_application, threads, on_startup=(), on_shutdown=()):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body = await self.read_body(receive)
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(
+            self.executor, self.run_wsgi, scope, body)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for callback in self.on_startup:
+                    callback()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown()
+                for callback in self.on_shutdown:
+                    callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(body)
+
+    @staticmethod
+    def environ(scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+            'PATH_INFO': scope['path'].encode().decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1').upper().replace('-', '_')
+            key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+            value = value.decode('latin1')
+            if key in environ:
+                separator = '; ' if key == 'HTTP_COOKIE' else ','
+                value = environ[key] + separator + value
+            environ[key] = value
+        return environ
+
+    def run_wsgi(self, scope, body):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                                   for name, value in headers]
+
+        result = self.wsgi_application(self.environ(scope, body), start_response)
+        try:
+            # Pages are rendered up front, so buffering the body costs nothing.
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+
+def get_asgi_application():
+    from django.conf import settings
+    from blog.counters import view_counter
+    wsgi_application = get_wsgi_application()
+    return WsgiToAsgi(wsgi_application, settings.ASGI_THREADS,
+                      on_startup=[view_counter.start], on_shutdown=[view_counter.stop])
+
+
+application = get_asgi_application()
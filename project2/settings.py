@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,20 +43,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'blog.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blog.middleware.AccessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.page_cache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'project2.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for blog.metrics.
+        'BACKEND': 'blog.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -71,6 +77,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project2.wsgi.application'
 
+# Requests project2.asgi runs at once per process. Each one holds a thread
+# and a database connection while it runs.
+ASGI_THREADS = 16
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -79,9 +89,107 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # A copy of the primary kept fresh by the sync_replica command. List and
+    # detail pages read from it once it exists.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Old posts moved out of the primary by archive_posts, which creates it.
+    'archive': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.archive.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['blog.routers.PrimaryReplicaRouter']
+
+# Clients that wrote read from the primary for this many seconds, which
+# should exceed the sync_replica interval.
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 10
+
+# archive_posts moves published posts older than this to the archive.
+ARCHIVE_AFTER_DAYS = 180
+
+# Applied to every new SQLite connection. WAL lets readers run alongside
+# the writer and synchronous=NORMAL is safe in WAL mode; reads go through
+# a memory map of up to mmap_size bytes.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# Set AUTH_CACHE_ENABLED to serve the session and the user of authenticated
+# requests from a process-local cache instead of two queries per request.
+# Entries are dropped on logout and whenever the user is saved, in the
+# process doing it; other worker processes keep them for at most
+# AUTH_CACHE_TIMEOUT seconds, sessions included (see blog.auth.SessionStore).
+AUTH_CACHE_ENABLED = False
+AUTH_CACHE_ALIAS = 'auth'
+AUTH_CACHE_TIMEOUT = 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    AUTH_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+        'TIMEOUT': AUTH_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Group and post cards are cached as rendered HTML under the id and
+# date_updated of their object, so a change to the object misses its old
+# entry, which is then evicted as least recently used. Choose the backend
+# with FRAGMENT_CACHE_BACKEND: 'locmem' is per process, 'file' and 'sqlite'
+# are shared by the processes of a host, and only 'file' evicts at random.
+FRAGMENT_CACHE_BACKEND = 'locmem'
+FRAGMENT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'project2-fragments')
+FRAGMENT_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': FRAGMENT_CACHE_DIR,
+    },
+    'sqlite': {
+        'BACKEND': 'blog.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(FRAGMENT_CACHE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_SIZE': 64 * 1024 * 1024},
+    },
+}
+# The alias the {% cache %} template tag uses.
+CACHES['template_fragments'] = {
+    **FRAGMENT_CACHE_BACKENDS[FRAGMENT_CACHE_BACKEND],
+    'OPTIONS': {'MAX_ENTRIES': 10000,
+                **FRAGMENT_CACHE_BACKENDS[FRAGMENT_CACHE_BACKEND].get('OPTIONS', {})},
 }
 
+# Whole pages shared by visitors, see blog.page_cache. They are kept with the
+# fragments, and anonymous pages are re-rendered every PAGE_CACHE_TIMEOUT
+# seconds to pick up template changes.
+PAGE_CACHE_ALIAS = 'template_fragments'
+PAGE_CACHE_TIMEOUT = 600
+PAGE_CACHE_ANONYMOUS_ROUTES = ['home_page', 'login', 'registration']
+
+if AUTH_CACHE_ENABLED:
+    AUTHENTICATION_BACKENDS = ['blog.auth.CachedModelBackend']
+    SESSION_ENGINE = 'blog.auth'
+    SESSION_CACHE_ALIAS = AUTH_CACHE_ALIAS
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -126,4 +234,48 @@ LOGIN_ERROR_MESSAGE ="Wrong credentials, try again"
 REGISTRATION_PASSWORDS_ERROR_MESSAGE = "Passwords don't match"
 REGISTRATION_USER_EXISTS_ERROR_MESSAGE = "User with this username already exists"
 
+POSTS_PAGE_SIZE = 20
+GROUPS_PAGE_SIZE = 20
+# The number of groups per theme on the unfiltered directory is recounted
+# at most this often; other processes may show counts this many seconds old.
+THEME_COUNTS_TIMEOUT = 60
+
+# Posts of groups with more members than this are merged into feeds on read
+# instead of being copied into every member's timeline.
+TIMELINE_FANOUT_LIMIT = 1000
+# How many recent posts of a group are copied into the timeline on joining.
+TIMELINE_BACKFILL = 50
+
+# Per-route histograms of blog.metrics. Each process writes its own to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds; /metrics adds them up
+# for the addresses in METRICS_ALLOWED_IPS.
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'project2-metrics')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+# Add a Server-Timing header with the app, SQL and template time.
+METRICS_SERVER_TIMING = DEBUG
+
+# Tasks of blog.queue are retried this many times, waiting TASK_RETRY_DELAY
+# seconds after the first failure and twice as long after each next one.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 30
+TASK_MAX_RETRY_DELAY = 3600
+# A claimed task is given back to the queue if its worker has not finished
+# it after this many seconds.
+TASK_VISIBILITY_TIMEOUT = 300
+
+# Post views are counted in memory and added to the posts every
+# VIEW_COUNT_FLUSH_INTERVAL seconds, see blog.counters. Counts that can't be
+# written at exit wait in VIEW_COUNT_SPOOL_DIR for the next flush.
+VIEW_COUNT_FLUSH_INTERVAL = 5
+VIEW_COUNT_BATCH_SIZE = 300
+VIEW_COUNT_SPOOL_DIR = os.path.join(BASE_DIR, 'spool', 'view_counts')
+
+# Group activity behind /groups/trending/, see blog.trending. Each event adds
+# its weight to the group's score, which halves every TRENDING_HALF_LIFE
+# seconds.
+TRENDING_HALF_LIFE = 24 * 60 * 60
+TRENDING_WEIGHTS = {'post': 3, 'join': 1, 'invite': 1}
+TRENDING_GROUPS = 20
+
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
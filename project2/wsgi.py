@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project2.settings')
 
 application = get_wsgi_application()
+
+from blog.counters import view_counter  # noqa: E402, needs the apps loaded
+
+view_counter.start()